@@ -21,11 +21,14 @@ import base64
 import logging
 import logging.handlers
 import os
+import queue
 import sys
 import tempfile
 import threading
+import time
 import traceback
 import uuid
+from concurrent.futures import Future
 from io import BytesIO
 
 import torch
@@ -137,6 +140,8 @@ os.makedirs(SAVE_DIR, exist_ok=True)
 
 worker_id = str(uuid.uuid4())[:6]
 logger = build_logger("controller", f"{SAVE_DIR}/controller.log")
+# the `BatchScheduler` of the worker, set at startup
+scheduler = None
 
 
 def load_image_from_base64(image):
@@ -171,11 +176,10 @@ class ModelWorker:
             self.pipeline_tex = Hunyuan3DPaintPipeline.from_pretrained(tex_model_path)
 
     def get_queue_length(self):
-        if model_semaphore is None:
+        """Requests waiting in the batch scheduler plus the ones it is running."""
+        if scheduler is None:
             return 0
-        else:
-            return args.limit_model_concurrency - model_semaphore._value + (len(
-                model_semaphore._waiters) if model_semaphore._waiters is not None else 0)
+        return len(scheduler) + scheduler.in_flight
 
     def get_status(self):
         return {
@@ -183,8 +187,8 @@ class ModelWorker:
             "queue_length": self.get_queue_length(),
         }
 
-    @torch.inference_mode()
-    def generate(self, uid, params):
+    def prepare(self, params):
+        """Input image and defaults of one request, everything that runs before the shape pipeline."""
         if 'image' in params:
             image = params["image"]
             image = load_image_from_base64(image)
@@ -198,25 +202,68 @@ class ModelWorker:
         image = self.rembg(image)
         params['image'] = image
 
-        if 'mesh' in params:
-            mesh = trimesh.load(BytesIO(base64.b64decode(params["mesh"])), file_type='glb')
-        else:
+        if 'mesh' not in params:
             seed = params.get("seed", 1234)
             params['generator'] = torch.Generator(self.device).manual_seed(seed)
             params['octree_resolution'] = params.get("octree_resolution", 128)
             params['num_inference_steps'] = params.get("num_inference_steps", 5)
             params['guidance_scale'] = params.get('guidance_scale', 5.0)
+            params['num_chunks'] = params.get('num_chunks', 8000)
             params['mc_algo'] = 'mc'
-            import time
+        return params
+
+    @staticmethod
+    def batch_key(params):
+        """Requests with equal keys share one pipeline call, see `BatchScheduler`."""
+        if 'mesh' in params:
+            return None
+        shared = {k: v for k, v in params.items() if k not in PER_REQUEST_PARAMS}
+        return repr(sorted(shared.items()))
+
+    @torch.inference_mode()
+    def generate_batch(self, uids, params_list):
+        """
+        Run requests with the same `batch_key` through a single pipeline call: their images are stacked into one
+        batch and every request keeps its own generator, guidance scale, step count and chunk size. Returns
+        (save_path, uid) per request, or the exception that request failed with.
+        """
+        if self.batch_key(params_list[0]) is None:
+            meshes = [trimesh.load(BytesIO(base64.b64decode(params["mesh"])), file_type='glb')
+                      for params in params_list]
+        else:
+            pipeline_params = {k: v for k, v in params_list[0].items() if k not in PER_REQUEST_PARAMS}
             start_time = time.time()
-            mesh = self.pipeline(**params)[0]
-            logger.info("--- %s seconds ---" % (time.time() - start_time))
+            meshes = self.pipeline(
+                image=[params['image'] for params in params_list],
+                generator=[params['generator'] for params in params_list],
+                guidance_scale=[params['guidance_scale'] for params in params_list],
+                num_inference_steps=[params['num_inference_steps'] for params in params_list],
+                num_chunks=[params['num_chunks'] for params in params_list],
+                **pipeline_params,
+            )
+            logger.info("--- %s seconds for %d requests ---" % (time.time() - start_time, len(params_list)))
+            logger.info(f"Sampling stats: {self.pipeline.sampling_stats}")
+
+        outputs = []
+        for uid, params, mesh in zip(uids, params_list, meshes):
+            # a failing request must not fail the others of its batch
+            try:
+                outputs.append(self.save_mesh(uid, params, mesh))
+            except Exception as e:
+                traceback.print_exc()
+                outputs.append(e)
 
+        torch.cuda.empty_cache()
+        return outputs
+
+    def save_mesh(self, uid, params, mesh):
+        if mesh is None:
+            raise ValueError("Surface extraction failed, no mesh was generated")
         if params.get('texture', False):
             mesh = FloaterRemover()(mesh)
             mesh = DegenerateFaceRemover()(mesh)
             mesh = FaceReducer()(mesh, max_facenum=params.get('face_count', 40000))
-            mesh = self.pipeline_tex(mesh, image)
+            mesh = self.pipeline_tex(mesh, params['image'])
 
         type = params.get('type', 'glb')
         with tempfile.NamedTemporaryFile(suffix=f'.{type}', delete=False) as temp_file:
@@ -224,10 +271,99 @@ class ModelWorker:
             mesh = trimesh.load(temp_file.name)
             save_path = os.path.join(SAVE_DIR, f'{str(uid)}.{type}')
             mesh.export(save_path)
-
-        torch.cuda.empty_cache()
         return save_path, uid
 
+    def generate(self, uid, params):
+        output = self.generate_batch([uid], [self.prepare(params)])[0]
+        if isinstance(output, Exception):
+            raise output
+        return output
+
+
+# parameters that may differ between the requests of one batch
+PER_REQUEST_PARAMS = {'image', 'text', 'mesh', 'seed', 'generator', 'guidance_scale', 'num_inference_steps',
+                      'num_chunks', 'texture', 'face_count', 'type'}
+
+
+class BatchScheduler:
+    """
+    Serializes the requests of all endpoints through one thread and batches them. Requests arriving within
+    `window` seconds of the first queued one (up to `max_batch_size`) are collected, grouped by
+    `ModelWorker.batch_key`, and every group runs as one pipeline call, so the denoiser sees one batch instead of
+    one call per request. Results and errors are handed back through the future returned by `submit`.
+    """
+
+    def __init__(self, worker, max_batch_size=8, window=0.05):
+        self.worker = worker
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.queue = queue.Queue()
+        # requests taken from the queue whose future is not resolved yet
+        self.in_flight = 0
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, uid, params) -> Future:
+        future = Future()
+        self.queue.put((uid, params, future))
+        return future
+
+    def __len__(self):
+        """Requests waiting in the queue, see `in_flight` for the ones running."""
+        return self.queue.qsize()
+
+    def resolve(self, future, output=None, exception=None):
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(output)
+        self.in_flight -= 1
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def loop(self):
+        while True:
+            groups = {}
+            batch = self.collect()
+            self.in_flight += len(batch)
+            for uid, params, future in batch:
+                try:
+                    params = self.worker.prepare(params)
+                except Exception as e:
+                    # /send does not wait on the future, log the error here
+                    traceback.print_exc()
+                    self.resolve(future, exception=e)
+                    continue
+                # requests that are not batchable (key None) run on their own
+                key = self.worker.batch_key(params)
+                groups.setdefault(key if key is not None else uid, []).append((uid, params, future))
+
+            for group in groups.values():
+                uids, params_list, futures = zip(*group)
+                try:
+                    outputs = self.worker.generate_batch(list(uids), list(params_list))
+                except Exception as e:
+                    traceback.print_exc()
+                    for future in futures:
+                        self.resolve(future, exception=e)
+                    continue
+                for future, output in zip(futures, outputs):
+                    if isinstance(output, Exception):
+                        self.resolve(future, exception=output)
+                    else:
+                        self.resolve(future, output)
+
 
 app = FastAPI()
 from fastapi.middleware.cors import CORSMiddleware
@@ -247,7 +383,7 @@ async def generate(request: Request):
     params = await request.json()
     uid = uuid.uuid4()
     try:
-        file_path, uid = worker.generate(uid, params)
+        file_path, uid = await asyncio.wrap_future(scheduler.submit(uid, params))
         return FileResponse(file_path)
     except ValueError as e:
         traceback.print_exc()
@@ -279,11 +415,16 @@ async def generate(request: Request):
     logger.info("Worker send...")
     params = await request.json()
     uid = uuid.uuid4()
-    threading.Thread(target=worker.generate, args=(uid, params,)).start()
+    scheduler.submit(uid, params)
     ret = {"uid": str(uid)}
     return JSONResponse(ret, status_code=200)
 
 
+@app.get("/status")
+async def worker_status():
+    return JSONResponse(worker.get_status(), status_code=200)
+
+
 @app.get("/status/{uid}")
 async def status(uid: str):
     save_file_path = os.path.join(SAVE_DIR, f'{uid}.glb')
@@ -330,6 +471,8 @@ if __name__ == "__main__":
     parser.add_argument("--device", type=str, default="cuda")
     parser.add_argument("--limit-model-concurrency", type=int, default=5)
     parser.add_argument('--enable_tex', action='store_true')
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=50)
     args = parser.parse_args()
     logger.info(f"args: {args}")
 
@@ -337,4 +480,5 @@ if __name__ == "__main__":
 
     worker = ModelWorker(model_path=args.model_path, device=args.device, enable_tex=args.enable_tex,
                          tex_model_path=args.tex_model_path)
+    scheduler = BatchScheduler(worker, max_batch_size=args.max_batch_size, window=args.batch_window_ms / 1000)
     uvicorn.run(app, host=args.host, port=args.port, log_level="info")
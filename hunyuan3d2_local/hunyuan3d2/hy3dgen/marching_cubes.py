@@ -0,0 +1,33 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+"""
+Marching cubes kernel run by the worker processes of `BlockMCSurfaceExtractor`. Workers are spawned and import
+this module to unpickle the kernel, so it only depends on numpy and skimage: importing `hy3dgen.shapegen` would
+load torch and diffusers in every worker.
+"""
+
+import numpy as np
+from skimage import measure
+
+
+def marching_cubes_block(volume: np.ndarray, level: float):
+    """Marching cubes on one slab, None if the surface does not cross it."""
+    if level < volume.min() or level > volume.max():
+        return None
+    try:
+        vertices, faces, _, _ = measure.marching_cubes(volume, level, method="lewiner")
+    except RuntimeError:
+        return None
+    return vertices, faces
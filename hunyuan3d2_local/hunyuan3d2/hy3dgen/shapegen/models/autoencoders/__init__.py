@@ -15,6 +15,11 @@
 from .attention_blocks import CrossAttentionDecoder
 from .attention_processors import FlashVDMCrossAttentionProcessor, CrossAttentionProcessor, \
     FlashVDMTopMCrossAttentionProcessor
+from .cross_sections import CrossSection, PlanarSectionDecoder
+from .decoded_shape import DecodedShape, DecodedShapeCache
 from .model import ShapeVAE, VectsetVAE
-from .surface_extractors import SurfaceExtractors, MCSurfaceExtractor, DMCSurfaceExtractor, Latent2MeshOutput
+from .point_queries import OccupancyCache, PointOccupancyDecoder
+from .sparse_volume import SparseVolume
+from .surface_extractors import SurfaceExtractors, MCSurfaceExtractor, BlockMCSurfaceExtractor, \
+    SparseMCSurfaceExtractor, DMCSurfaceExtractor, DualMCSurfaceExtractor, Latent2MeshOutput
 from .volume_decoders import HierarchicalVolumeDecoding, FlashVDMVolumeDecoding, VanillaVolumeDecoder
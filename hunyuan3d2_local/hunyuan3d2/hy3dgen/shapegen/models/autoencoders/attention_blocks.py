@@ -14,6 +14,7 @@
 
 
 import os
+from contextlib import contextmanager
 from typing import Optional, Union, List
 
 import torch
@@ -22,7 +23,6 @@ from einops import rearrange
 from torch import Tensor
 
 from .attention_processors import CrossAttentionProcessor
-from ...utils import logger
 
 scaled_dot_product_attention = nn.functional.scaled_dot_product_attention
 
@@ -110,6 +110,16 @@ class FourierEmbedder(nn.Module):
 
         return out_dim
 
+    def column_axis(self, input_dim: int = 3) -> torch.Tensor:
+        """Index of the input dimension each output channel is computed from, shape [out_dim]."""
+        axis = torch.arange(input_dim)
+        if self.num_freqs == 0:
+            return axis
+        freq_axis = axis.repeat_interleave(self.num_freqs)
+        if self.include_input:
+            return torch.cat((axis, freq_axis, freq_axis))
+        return torch.cat((freq_axis, freq_axis))
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """ Forward process.
 
@@ -227,7 +237,6 @@ class MultiheadCrossAttention(nn.Module):
         data_width: Optional[int] = None,
         norm_layer=nn.LayerNorm,
         qk_norm: bool = False,
-        kv_cache: bool = False,
     ):
         super().__init__()
         self.n_data = n_data
@@ -244,19 +253,15 @@ class MultiheadCrossAttention(nn.Module):
             norm_layer=norm_layer,
             qk_norm=qk_norm
         )
-        self.kv_cache = kv_cache
-        self.data = None
 
-    def forward(self, x, data):
+    def forward(self, x, data=None, kv=None):
         x = self.c_q(x)
-        if self.kv_cache:
-            if self.data is None:
-                self.data = self.c_kv(data)
-                logger.info('Save kv cache,this should be called only once for one mesh')
-            data = self.data
-        else:
-            data = self.c_kv(data)
-        x = self.attention(x, data)
+        if kv is None:
+            kv = self.c_kv(data)
+        if kv.shape[0] != x.shape[0]:
+            # a single cached projection is shared by every query batch
+            kv = kv.expand(x.shape[0], -1, -1)
+        x = self.attention(x, kv)
         x = self.c_proj(x)
         return x
 
@@ -293,8 +298,13 @@ class ResidualCrossAttentionBlock(nn.Module):
         self.ln_3 = norm_layer(width, elementwise_affine=True, eps=1e-6)
         self.mlp = MLP(width=width, expand_ratio=mlp_expand_ratio)
 
-    def forward(self, x: torch.Tensor, data: torch.Tensor):
-        x = x + self.attn(self.ln_1(x), self.ln_2(data))
+    def project_kv(self, data: torch.Tensor):
+        return self.attn.c_kv(self.ln_2(data))
+
+    def forward(self, x: torch.Tensor, data: torch.Tensor = None, kv: torch.Tensor = None):
+        if kv is None:
+            kv = self.project_kv(data)
+        x = x + self.attn(self.ln_1(x), kv=kv)
         x = x + self.mlp(self.ln_3(x))
         return x
 
@@ -474,6 +484,7 @@ class CrossAttentionDecoder(nn.Module):
         self.output_proj = nn.Linear(width, out_channels)
         self.label_type = label_type
         self.count = 0
+        self._latents_cache = None
 
     def set_cross_attention_processor(self, processor):
         self.cross_attn_decoder.attn.attention.attn_processor = processor
@@ -481,13 +492,74 @@ class CrossAttentionDecoder(nn.Module):
     def set_default_cross_attention_processor(self):
         self.cross_attn_decoder.attn.attention.attn_processor = CrossAttentionProcessor
 
-    def forward(self, queries=None, query_embeddings=None, latents=None):
+    def grid_query_tables(self, axes: List[torch.Tensor]) -> List[torch.Tensor]:
+        """
+        Per-axis query embedding tables of an axis-aligned grid.
+
+        The fourier embedding treats every coordinate separately and `query_proj` is linear, so the embedding
+        of grid point (i, j, k) is `tables[0][i] + tables[1][j] + tables[2][k]`. The bias is folded into the
+        first table.
+
+        Args:
+            axes: the grid coordinates along each axis, each of shape [n_axis].
+
+        Returns:
+            tables: list of tensors of shape [n_axis, width].
+        """
+        weight, bias = self.query_proj.weight, self.query_proj.bias
+        column_axis = self.fourier_embedder.column_axis(len(axes)).to(weight.device)
+        tables = []
+        for i, axis in enumerate(axes):
+            columns = column_axis == i
+            coords = axis.to(weight)[:, None].expand(-1, len(axes))
+            embed = self.fourier_embedder(coords).to(weight.dtype)[:, columns]
+            tables.append(nn.functional.linear(embed, weight[:, columns]))
+        tables[0] = tables[0] + bias
+        return tables
+
+    @staticmethod
+    def grid_query_embeddings(tables: List[torch.Tensor], index: torch.LongTensor) -> torch.Tensor:
+        """Query embeddings for integer grid coordinates `index` of shape [..., 3], see `grid_query_tables`."""
+        embeddings = tables[0][index[..., 0]]
+        for i in range(1, len(tables)):
+            embeddings += tables[i][index[..., i]]
+        return embeddings
+
+    def project_latents(self, latents: torch.Tensor) -> torch.Tensor:
+        """Keys/values of the cross attention for `latents`, shape [batch, num_latents, width * 2]."""
+        if self.downsample_ratio != 1:
+            latents = self.latents_proj(latents)
+        return self.cross_attn_decoder.project_kv(latents)
+
+    @contextmanager
+    def cache_latents(self, latents: torch.Tensor, kv: Optional[torch.Tensor] = None):
+        """
+        Project `latents` once and reuse the keys/values for every call made with the same tensor inside this
+        context. Calls with any other latents are computed as usual, and the cache is dropped on exit. `kv`
+        passes keys/values projected earlier by `project_latents`.
+        """
+        previous = self._latents_cache
+        self._latents_cache = (latents, self.project_latents(latents) if kv is None else kv)
+        try:
+            yield
+        finally:
+            self._latents_cache = previous
+
+    def forward(self, queries=None, query_embeddings=None, latents=None, latent_index=None):
+        """
+        `latent_index` optionally gives, for every query batch row, the row of `latents` it attends to. This lets
+        one call decode queries of several samples while still reusing the keys/values cached for `latents`.
+        """
         if query_embeddings is None:
             query_embeddings = self.query_proj(self.fourier_embedder(queries).to(latents.dtype))
         self.count += query_embeddings.shape[1]
-        if self.downsample_ratio != 1:
-            latents = self.latents_proj(latents)
-        x = self.cross_attn_decoder(query_embeddings, latents)
+        if self._latents_cache is not None and self._latents_cache[0] is latents:
+            kv = self._latents_cache[1]
+        else:
+            kv = self.project_latents(latents)
+        if latent_index is not None:
+            kv = kv[latent_index]
+        x = self.cross_attn_decoder(query_embeddings, kv=kv)
         if self.enable_ln_post:
             x = self.ln_post(x)
         occ = self.output_proj(x)
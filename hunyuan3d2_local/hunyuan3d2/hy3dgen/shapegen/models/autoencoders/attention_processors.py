@@ -32,9 +32,46 @@ class CrossAttentionProcessor:
         return out
 
 
+def cell_layout(counts: torch.LongTensor):
+    """
+    Indices that pad queries grouped in consecutive cells of `counts` queries into a [num_cells, max_count] layout:
+    query n goes to (cell[n], pos[n]).
+    """
+    cell = torch.repeat_interleave(torch.arange(counts.shape[0], device=counts.device), counts)
+    starts = torch.cumsum(counts, 0) - counts
+    pos = torch.arange(cell.shape[0], device=counts.device) - starts[cell]
+    return cell, pos
+
+
+def gather_cell_keys(x: torch.Tensor, rows: torch.LongTensor, index: torch.LongTensor) -> torch.Tensor:
+    """
+    Per-cell selection of keys or values. `x` has shape [b, h, L, d], cell i takes its keys from row `rows[i]` and
+    `index` holds key indices of shape [num_cells, h, n], broadcastable, the result has shape [num_cells, h, n, d].
+    """
+    h = x.shape[1]
+    head_index = torch.arange(h, device=x.device)[None, :, None]
+    # advanced indexing copies whole rows of d, torch.gather would look up every element
+    return x[rows[:, None, None], head_index, index]
+
+
 class FlashVDMCrossAttentionProcessor:
-    def __init__(self, topk=None):
+    """
+    Cross attention with adaptive kv selection. `topk` selects the mode of the next call, and is reset to False
+    after it:
+        True: every batch row (a mini grid) attends to its own top-k keys.
+        False: plain attention over all keys.
+        counts: a [num_cells] tensor, the queries of every batch row are grouped in consecutive cells of `counts`
+            queries and every cell attends to its own keys. A [b, num_cells] tensor gives every batch row its own
+            cells, zero counts pad the shorter rows and queries past the last cell of a row are left zero. Cells
+            of similar size, from any row, are padded to a common length and attended together, see
+            `group_cells`.
+    """
+
+    sample_stride = 50
+
+    def __init__(self, topk=None, cell_group_size: int = 32):
         self.topk = topk
+        self.cell_group_size = cell_group_size
 
     def __call__(self, attn, q, k, v):
         if k.shape[-2] == 3072:
@@ -56,41 +93,91 @@ class FlashVDMCrossAttentionProcessor:
         elif self.topk is False:
             out = scaled_dot_product_attention(q, k, v)
         else:
-            idx, counts = self.topk
-            start = 0
-            outs = []
-            for grid_coord, count in zip(idx, counts):
-                end = start + count
-                q_chunk = q[:, :, start:end, :]
-                k0, v0 = self.select_topkv(q_chunk, k, v, topk)
-                out = scaled_dot_product_attention(q_chunk, k0, v0)
-                outs.append(out)
-                start += count
-            out = torch.cat(outs, dim=-2)
+            counts = torch.as_tensor(self.topk, device=q.device)
+            b, h, _, d = q.shape
+            if counts.ndim == 1:
+                counts = counts.expand(b, -1)
+            starts = torch.cumsum(counts, -1) - counts
+            rows = torch.arange(b, device=q.device).repeat_interleave(counts.shape[-1])
+            counts, starts = counts.reshape(-1), starts.reshape(-1)
+            out = torch.zeros_like(q)
+            for group in self.group_cells(counts):
+                group_counts, group_rows = counts[group], rows[group]
+                cell, pos = cell_layout(group_counts)
+                query_rows = group_rows[cell]
+                query_index = starts[group][cell] + pos
+                q_cells = q.new_zeros(group.shape[0], h, int(group_counts.max()), d)
+                q_cells[cell, :, pos] = q[query_rows, :, query_index]
+                out_cells = self.cell_attention(q_cells, k, v, group_counts, group_rows, topk)
+                out[query_rows, :, query_index] = out_cells[cell, :, pos]
         self.topk = False
         return out
 
-    def select_topkv(self, q_chunk, k, v, topk):
-        q1 = q_chunk[:, :, ::50, :]
-        sim = q1 @ k.transpose(-1, -2)
-        sim = torch.mean(sim, -2)
-        topk_ind = torch.topk(sim, dim=-1, k=topk).indices.squeeze(-2).unsqueeze(-1)
-        topk_ind = topk_ind.expand(-1, -1, -1, v.shape[-1])
-        v0 = torch.gather(v, dim=-2, index=topk_ind)
-        k0 = torch.gather(k, dim=-2, index=topk_ind)
-        return k0, v0
+    def group_cells(self, counts: torch.LongTensor):
+        """
+        Split cells into groups that are padded to a common length and attended in one call. Cells are taken
+        from the largest and a group holds at most `cell_group_size` cells whose sizes are within 3/4 of its
+        largest, which bounds the padding overhead. Empty cells are skipped.
+        """
+        order = torch.argsort(counts, descending=True)
+        sizes = counts[order].tolist()
+        if 0 in sizes:
+            order, sizes = order[:sizes.index(0)], sizes[:sizes.index(0)]
+        groups, first = [], 0
+        for i, size in enumerate(sizes):
+            if i - first == self.cell_group_size or size * 4 < sizes[first] * 3:
+                groups.append(order[first:i])
+                first = i
+        groups.append(order[first:])
+        return groups
+
+    def sampled_scores(self, q_cells, k, rows):
+        """Scores of every `sample_stride`-th query of every cell against the keys of its row, [num_cells, h, S, L]."""
+        q1 = q_cells[:, :, ::self.sample_stride]
+        num_cells, h, num_sampled, d = q1.shape
+        sim = q1.new_empty(num_cells, h, num_sampled, k.shape[-2])
+        for row in range(k.shape[0]):
+            cells = torch.nonzero(rows == row).squeeze(-1)
+            if cells.shape[0] == 0:
+                continue
+            # one [h, cells * S, d] @ [h, d, L] product per row, a broadcast matmul would copy the keys per cell
+            row_sim = q1[cells].transpose(0, 1).reshape(h, -1, d) @ k[row].transpose(-1, -2)
+            sim[cells] = row_sim.view(h, cells.shape[0], num_sampled, -1).transpose(0, 1)
+        return sim
+
+    def cell_attention(self, q_cells, k, v, counts, rows, topk):
+        """
+        Attention of cells of queries, each cell with its own keys. `q_cells` has shape [num_cells, h, max_count, d],
+        cell i holds `counts[i]` queries followed by zero padding and attends to the keys of batch row `rows[i]`.
+        """
+        # every cell scores the keys with a strided sample of its queries, padding queries add zero
+        num_sampled = (counts + self.sample_stride - 1) // self.sample_stride
+        sim = self.sampled_scores(q_cells, k, rows).sum(-2) / num_sampled[:, None, None]
+        topk_ind = torch.topk(sim, dim=-1, k=topk).indices
+        k0 = gather_cell_keys(k, rows, topk_ind)
+        v0 = gather_cell_keys(v, rows, topk_ind)
+        return scaled_dot_product_attention(q_cells, k0, v0)
 
 
 class FlashVDMTopMCrossAttentionProcessor(FlashVDMCrossAttentionProcessor):
-    def select_topkv(self, q_chunk, k, v, topk):
-        q1 = q_chunk[:, :, ::30, :]
-        sim = q1 @ k.transpose(-1, -2)
-        # sim = sim.to(torch.float32)
-        sim = sim.softmax(-1)
+    """Every cell attends to the union of the keys any of its sampled queries activates, in any head."""
+
+    sample_stride = 30
+
+    def cell_attention(self, q_cells, k, v, counts, rows, topk):
+        sim = self.sampled_scores(q_cells, k, rows).softmax(-1)
         sim = torch.mean(sim, 1)
-        activated_token = torch.where(sim > 1e-6)[2]
-        index = torch.unique(activated_token, return_counts=True)[0].unsqueeze(0).unsqueeze(0).unsqueeze(-1)
-        index = index.expand(-1, v.shape[1], -1, v.shape[-1])
-        v0 = torch.gather(v, dim=-2, index=index)
-        k0 = torch.gather(k, dim=-2, index=index)
-        return k0, v0
+        sampled = torch.arange(0, q_cells.shape[-2], self.sample_stride, device=q_cells.device)
+        activated = (sim > 1e-6) & (sampled[None, :] < counts[:, None])[:, :, None]
+        activated = activated.any(-2)
+
+        # the number of selected keys differs per cell: every cell gathers its keys, in key order, padded to the
+        # largest selection and masked. The masked call needs the torch kernel.
+        num_activated = activated.sum(-1)
+        max_activated = int(num_activated.max())
+        key_index = torch.sort(activated.to(torch.uint8), dim=-1, descending=True, stable=True).indices
+        key_index = key_index[:, None, :max_activated]
+        mask = torch.arange(max_activated, device=q_cells.device) < num_activated[:, None]
+        k0 = gather_cell_keys(k, rows, key_index)
+        v0 = gather_cell_keys(v, rows, key_index)
+        return F.scaled_dot_product_attention(q_cells, k0, v0, attn_mask=mask[:, None, None])
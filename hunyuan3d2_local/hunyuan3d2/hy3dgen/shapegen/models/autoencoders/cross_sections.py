@@ -0,0 +1,153 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+from typing import Union, Tuple, List, Sequence
+
+import numpy as np
+import torch
+from einops import repeat
+from skimage import measure
+from tqdm import tqdm
+
+from .attention_blocks import CrossAttentionDecoder
+from .volume_decoders import generate_grid_axes, iter_grid_chunks
+
+AXES = {'x': 0, 'y': 1, 'z': 2}
+
+
+class CrossSection:
+    """
+    Contours of the shape in the plane `axis` = `offset`.
+
+    `contours` are polylines of shape [n, 2] in the coordinates of `plane_axes`, the two remaining axes in
+    increasing order. Closed contours repeat their first point at the end. All contours wind the same way around
+    the inside of the shape (`positive_orientation='high'` of `skimage.measure.find_contours`), so holes can be
+    told apart from outlines by their signed area.
+    """
+
+    def __init__(self, axis: int, offset: float, contours: List[np.ndarray], logits: np.ndarray = None):
+        self.axis = axis
+        self.offset = offset
+        self.contours = contours
+        self.logits = logits
+
+    @property
+    def plane_axes(self) -> Tuple[int, int]:
+        return tuple(i for i in range(3) if i != self.axis)
+
+    def contours_3d(self) -> List[np.ndarray]:
+        """The contours as [n, 3] points in model coordinates."""
+        outputs = []
+        for contour in self.contours:
+            points = np.empty((contour.shape[0], 3), dtype=contour.dtype)
+            points[:, self.axis] = self.offset
+            points[:, self.plane_axes] = contour
+            outputs.append(points)
+        return outputs
+
+
+class PlanarSectionDecoder:
+    """
+    Decodes the occupancy of axis-aligned planes only and extracts their contours with 2D marching squares, so
+    slicing a shape costs planes x resolution^2 queries instead of a full resolution^3 volume.
+    """
+
+    @torch.no_grad()
+    def __call__(
+        self,
+        latents: torch.FloatTensor,
+        geo_decoder: CrossAttentionDecoder,
+        axis: Union[int, str],
+        offsets: Sequence[float],
+        bounds: Union[Tuple[float], List[float], float] = 1.01,
+        resolution: int = 256,
+        thickness: float = 0.0,
+        num_thickness_samples: int = 1,
+        reduce: str = 'max',
+        mc_level: float = 0.0,
+        num_chunks: int = 10000,
+        return_logits: bool = False,
+        enable_pbar: bool = True,
+        **kwargs,
+    ) -> List[List[CrossSection]]:
+        """
+        Args:
+            axis: the plane normal, 0/1/2 or 'x'/'y'/'z'.
+            offsets: the plane positions along `axis`, in model coordinates.
+            resolution: number of cells per plane axis, the plane grid has resolution + 1 points per axis.
+            thickness: the slab thickness around every plane. The occupancy is sampled at
+                `num_thickness_samples` evenly spaced planes across the slab and combined with `reduce`: 'max'
+                (union, the slab silhouette), 'min' (intersection, what every layer of the slab covers) or 'mean'.
+            return_logits: keep the reduced [resolution + 1, resolution + 1] logits on every section.
+
+        Returns:
+            for every sample of the batch, one `CrossSection` per offset.
+        """
+        if isinstance(axis, str):
+            axis = AXES[axis.lower()]
+        if reduce not in ('max', 'min', 'mean'):
+            raise ValueError(f'Unsupported reduce {reduce}, available: {["max", "min", "mean"]}')
+        if isinstance(bounds, float):
+            bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
+        bbox_min, bbox_max = np.array(bounds[0:3]), np.array(bounds[3:6])
+
+        device = latents.device
+        dtype = latents.dtype
+        batch_size = latents.shape[0]
+        num_planes = len(offsets)
+        num_samples = num_thickness_samples if thickness > 0 else 1
+        plane_axes = [i for i in range(3) if i != axis]
+
+        # 1. per-axis query tables, the normal axis holds every sampled plane position
+        layers = np.linspace(-thickness / 2, thickness / 2, num_samples) if num_samples > 1 else np.zeros(1)
+        positions = (np.asarray(offsets, dtype=np.float64)[:, None] + layers[None]).reshape(-1)
+        axes = generate_grid_axes(bbox_min, bbox_max, resolution)
+        axes[axis] = positions.astype(np.float32)
+        tables = geo_decoder.grid_query_tables([torch.from_numpy(values).to(device, dtype=dtype) for values in axes])
+        # columns of the [layer, u, v] grid index in x, y, z order
+        columns = [0 if i == axis else plane_axes.index(i) + 1 for i in range(3)]
+
+        # 2. latents to plane logits, the grid is laid out as [plane layer, u, v]
+        grid_size = [positions.shape[0], int(resolution) + 1, int(resolution) + 1]
+        num_points = int(np.prod(grid_size))
+        grid_logits = torch.empty((batch_size, num_points), dtype=torch.float32, device=device)
+        for start, index in tqdm(iter_grid_chunks(grid_size, num_chunks, device), desc="Section Decoding",
+                                 total=-(-num_points // num_chunks), disable=not enable_pbar):
+            query_embeddings = geo_decoder.grid_query_embeddings(tables, index[:, columns])
+            query_embeddings = repeat(query_embeddings, "p c -> b p c", b=batch_size)
+            logits = geo_decoder(query_embeddings=query_embeddings, latents=latents)
+            grid_logits[:, start:start + index.shape[0]] = logits[..., 0]
+
+        grid_logits = grid_logits.view(batch_size, num_planes, num_samples, grid_size[1], grid_size[2])
+        if reduce == 'max':
+            grid_logits = grid_logits.amax(dim=2)
+        elif reduce == 'min':
+            grid_logits = grid_logits.amin(dim=2)
+        else:
+            grid_logits = grid_logits.mean(dim=2)
+        grid_logits = grid_logits.cpu().numpy()
+
+        # 3. marching squares, index coordinates are mapped back to the sampled positions
+        origin = bbox_min[plane_axes]
+        spacing = (bbox_max - bbox_min)[plane_axes] / int(resolution)
+        outputs = []
+        for i in range(batch_size):
+            sections = []
+            for j, offset in enumerate(offsets):
+                contours = measure.find_contours(grid_logits[i, j], mc_level, positive_orientation='high')
+                contours = [(contour * spacing + origin).astype(np.float32) for contour in contours]
+                logits = grid_logits[i, j] if return_logits else None
+                sections.append(CrossSection(axis, float(offset), contours, logits=logits))
+            outputs.append(sections)
+        return outputs
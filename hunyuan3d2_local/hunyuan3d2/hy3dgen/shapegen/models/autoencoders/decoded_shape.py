@@ -0,0 +1,193 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+from collections import OrderedDict
+from typing import Union, Tuple, List, Dict, Hashable, Optional
+
+import numpy as np
+import torch
+
+from .sparse_volume import SparseVolume
+from .surface_extractors import Latent2MeshOutput
+from .volume_decoders import VanillaVolumeDecoder, decode_grid_keys, grid_query_tables, next_level_keys, \
+    octree_resolutions
+from ...utils import synchronize_timer
+
+
+class DecodedShape:
+    """
+    A shape decoded once and meshed many times.
+
+    Holds the transformer output of the VAE, the keys/values the geometry decoder projects from it and every
+    occupancy value decoded so far, per (bounds, resolution) grid. Meshing requests run the hierarchical decoding
+    of `HierarchicalVolumeDecoding` against these stores and only query the points that were never evaluated, so
+    changing `mc_level` re-decodes the difference of the narrow bands only, and repeating a request (or meshing
+    with a coarser `octree_resolution` on the same levels) decodes nothing.
+    """
+
+    def __init__(self, vae, latents: torch.FloatTensor):
+        """`latents` are the output of `vae(latents)`, i.e. after post_kl and the transformer."""
+        self.vae = vae
+        self.latents = latents
+        with torch.no_grad():
+            self.kv = vae.geo_decoder.project_latents(latents)
+        # (bounds, resolution) -> dense [B, n, n, n] logits for the coarsest levels, one SparseVolume per sample
+        # for the refined ones
+        self.stores: Dict[Tuple, Union[torch.Tensor, List[SparseVolume]]] = {}
+        self.num_queries = 0
+
+    @classmethod
+    @torch.no_grad()
+    def from_diffusion_latents(cls, vae, latents: torch.FloatTensor):
+        """Session for the raw latents of the diffusion model, as `_export` of the pipelines receives them."""
+        return cls(vae, vae(1. / vae.scale_factor * latents))
+
+    @property
+    def batch_size(self) -> int:
+        return self.latents.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the session, latents and keys/values included."""
+        size = self.latents.nbytes + self.kv.nbytes
+        for store in self.stores.values():
+            if isinstance(store, torch.Tensor):
+                size += store.nbytes
+            else:
+                size += sum(volume.keys.nbytes + volume.values.nbytes for volume in store)
+        return size
+
+    @torch.no_grad()
+    def volumes(
+        self,
+        bounds: Union[Tuple[float], List[float], float] = 1.01,
+        octree_resolution: int = 384,
+        mc_level: float = 0.0,
+        min_resolution: int = 63,
+        num_chunks: int = 10000,
+        enable_pbar: bool = True,
+        **kwargs,
+    ) -> List[SparseVolume]:
+        """The output of `HierarchicalVolumeDecoding` for these arguments, decoding only what is missing."""
+        if isinstance(bounds, float):
+            bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
+        bounds = tuple(float(b) for b in bounds)
+        bbox_min, bbox_max = np.array(bounds[0:3]), np.array(bounds[3:6])
+        geo_decoder, latents = self.vae.geo_decoder, self.latents
+        device, dtype = latents.device, latents.dtype
+        resolutions = octree_resolutions(octree_resolution, min_resolution)
+
+        with geo_decoder.cache_latents(latents, kv=self.kv):
+            store_key = (bounds, resolutions[0])
+            if store_key not in self.stores:
+                self.stores[store_key] = VanillaVolumeDecoder()(
+                    latents, geo_decoder, bounds=list(bounds), num_chunks=num_chunks,
+                    octree_resolution=resolutions[0], enable_pbar=enable_pbar)
+                self.num_queries += self.stores[store_key][0].numel() * self.batch_size
+            volumes = list(self.stores[store_key])
+
+            for octree_depth_now in resolutions[1:]:
+                expand_num = 0 if octree_depth_now == resolutions[-1] else 1
+                next_keys = [next_level_keys(volume, mc_level, octree_depth_now, expand_num) for volume in volumes]
+                store_key = (bounds, octree_depth_now)
+                store = self.stores.get(store_key)
+                if store is None:
+                    store = [SparseVolume(keys.new_empty(0), latents.new_empty(0), octree_depth_now)
+                             for keys in next_keys]
+
+                missing = []
+                for keys, volume in zip(next_keys, store):
+                    _, found = volume.lookup(keys)
+                    missing.append(keys[~found])
+                if sum(keys.shape[0] for keys in missing) > 0:
+                    tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, octree_depth_now, device, dtype)
+                    values = decode_grid_keys(geo_decoder, latents, tables, missing, octree_depth_now + 1, num_chunks,
+                                              desc=f"Incremental Volume Decoding [r{octree_depth_now + 1}]",
+                                              enable_pbar=enable_pbar)
+                    store = [merge_volume(volume, keys, value)
+                             for volume, keys, value in zip(store, missing, values)]
+                    self.num_queries += sum(keys.shape[0] for keys in missing)
+                self.stores[store_key] = store
+
+                volumes = [SparseVolume(keys, volume.lookup(keys)[0], octree_depth_now)
+                           for keys, volume in zip(next_keys, store)]
+
+        return [volume if isinstance(volume, SparseVolume) else SparseVolume.from_dense(volume)
+                for volume in volumes]
+
+    def mesh(
+        self,
+        bounds: Union[Tuple[float], List[float], float] = 1.01,
+        octree_resolution: int = 384,
+        mc_level: float = 0.0,
+        **kwargs,
+    ) -> List[Optional[Latent2MeshOutput]]:
+        """
+        Meshes of every sample with the surface extractor of the VAE. Takes the arguments of
+        `VectsetVAE.latents2mesh`; the volume decoder of the VAE is replaced by the incremental one above.
+        """
+        kwargs.update(bounds=bounds, octree_resolution=octree_resolution, mc_level=mc_level)
+        with synchronize_timer('Volume decoding'):
+            volumes = self.volumes(**kwargs)
+        with synchronize_timer('Surface extraction'):
+            return self.vae.surface_extractor(volumes, **kwargs)
+
+
+def merge_volume(volume: SparseVolume, keys: torch.LongTensor, values: torch.Tensor) -> SparseVolume:
+    """`volume` with the points `keys` (not stored yet) added."""
+    keys, order = torch.sort(torch.cat([volume.keys, keys]))
+    values = torch.cat([volume.values, values.to(volume.dtype)])[order]
+    return SparseVolume(keys, values, volume.resolution, fill_value=volume.fill_value)
+
+
+class DecodedShapeCache:
+    """
+    Least recently used `DecodedShape` sessions, keyed by e.g. a request id. Evicts sessions beyond `capacity`
+    entries or, if set, beyond `max_bytes` of total session memory (see `DecodedShape.nbytes`).
+    """
+
+    def __init__(self, capacity: int = 8, max_bytes: Optional[int] = None):
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.sessions: 'OrderedDict[Hashable, DecodedShape]' = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, key: Hashable) -> Optional[DecodedShape]:
+        session = self.sessions.get(key)
+        if session is not None:
+            # sessions grow as they are meshed, so the limits are checked again on every access
+            self.sessions.move_to_end(key)
+            self.evict()
+        return session
+
+    def put(self, key: Hashable, session: DecodedShape):
+        self.sessions[key] = session
+        self.sessions.move_to_end(key)
+        self.evict()
+
+    def pop(self, key: Hashable) -> Optional[DecodedShape]:
+        return self.sessions.pop(key, None)
+
+    def evict(self):
+        """Drop the least recently used sessions until the limits hold, always keeping the most recent one."""
+        while len(self.sessions) > 1 and (
+            len(self.sessions) > self.capacity or
+            (self.max_bytes is not None and sum(s.nbytes for s in self.sessions.values()) > self.max_bytes)
+        ):
+            self.sessions.popitem(last=False)
@@ -22,6 +22,9 @@ import torch.nn as nn
 import yaml
 
 from .attention_blocks import FourierEmbedder, Transformer, CrossAttentionDecoder, PointCrossAttentionEncoder
+from .cross_sections import PlanarSectionDecoder
+from .decoded_shape import DecodedShape
+from .point_queries import PointOccupancyDecoder
 from .surface_extractors import MCSurfaceExtractor, SurfaceExtractors
 from .volume_decoders import VanillaVolumeDecoder, FlashVDMVolumeDecoding, HierarchicalVolumeDecoding
 from ...utils import logger, synchronize_timer, smart_load_model
@@ -168,13 +171,58 @@ class VectsetVAE(nn.Module):
         self.volume_decoder = volume_decoder
         self.surface_extractor = surface_extractor
 
-    def latents2mesh(self, latents: torch.FloatTensor, **kwargs):
-        with synchronize_timer('Volume decoding'):
-            grid_logits = self.volume_decoder(latents, self.geo_decoder, **kwargs)
+    def latents2mesh(self, latents: torch.FloatTensor, lod_resolutions: Union[str, List[int]] = None, **kwargs):
+        """
+        Args:
+            lod_resolutions: extract a mesh per level of detail from the same decoding pass. 'all' for every level
+                the volume decoder evaluates (e.g. 63, 127, 255, 383 for the hierarchical decoders), or a list of
+                resolutions, each served by the closest evaluated level.
+
+        Returns:
+            one `Latent2MeshOutput` per sample, or with `lod_resolutions` one {resolution: `Latent2MeshOutput`}
+            dict per sample, from coarse to fine.
+        """
+        if lod_resolutions is None:
+            with synchronize_timer('Volume decoding'), self.geo_decoder.cache_latents(latents):
+                grid_logits = self.volume_decoder(latents, self.geo_decoder, **kwargs)
+            with synchronize_timer('Surface extraction'):
+                outputs = self.surface_extractor(grid_logits, **kwargs)
+            return outputs
+
+        with synchronize_timer('Volume decoding'), self.geo_decoder.cache_latents(latents):
+            levels = self.volume_decoder(latents, self.geo_decoder, return_levels=True, **kwargs)
+        if lod_resolutions != 'all':
+            decoded = [resolution for resolution, _ in levels]
+            wanted = {min(decoded, key=lambda r: abs(r - resolution)) for resolution in lod_resolutions}
+            levels = [level for level in levels if level[0] in wanted]
+        outputs = [{} for _ in range(latents.shape[0])]
         with synchronize_timer('Surface extraction'):
-            outputs = self.surface_extractor(grid_logits, **kwargs)
+            for resolution, grid_logits in levels:
+                meshes = self.surface_extractor(grid_logits, **{**kwargs, 'octree_resolution': resolution})
+                for output, mesh in zip(outputs, meshes):
+                    output[resolution] = mesh
         return outputs
 
+    def query_occupancy(self, points, latents: torch.FloatTensor, **kwargs):
+        """
+        Occupancy logits of the transformer output `latents` at arbitrary points, without meshing. See
+        `PointOccupancyDecoder` for the arguments.
+        """
+        with synchronize_timer('Point queries'):
+            return PointOccupancyDecoder()(latents, self.geo_decoder, points, **kwargs)
+
+    def decoded_shape(self, latents: torch.FloatTensor) -> DecodedShape:
+        """Session that meshes the transformer output `latents` repeatedly, see `DecodedShape`."""
+        return DecodedShape(self, latents)
+
+    def latents2sections(self, latents: torch.FloatTensor, axis, offsets, **kwargs):
+        """
+        Contours of axis-aligned cross-sections, decoded from the planes only. See `PlanarSectionDecoder` for the
+        arguments.
+        """
+        with synchronize_timer('Section decoding'), self.geo_decoder.cache_latents(latents):
+            return PlanarSectionDecoder()(latents, self.geo_decoder, axis=axis, offsets=offsets, **kwargs)
+
     def enable_flashvdm_decoder(
         self,
         enabled: bool = True,
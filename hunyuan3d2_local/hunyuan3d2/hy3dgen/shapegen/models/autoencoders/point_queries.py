@@ -0,0 +1,159 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+import os
+from typing import Union, Tuple
+
+import numpy as np
+import torch
+from einops import repeat
+from tqdm import tqdm
+
+from .attention_blocks import CrossAttentionDecoder
+
+
+class OccupancyCache:
+    """
+    Logits decoded so far for one set of latents, keyed on point coordinates quantized to `quantum`.
+
+    Queries that go through the cache are snapped to the quantization grid before decoding, so every point of a
+    quantization cell reads the same value however the queries are ordered or batched. Coordinates beyond
+    2^20 cells from the origin are decoded exactly and not cached. The cache also keeps the keys/values of the
+    geometry decoder, and clears itself when used with other latents.
+    """
+    bits = 21
+
+    def __init__(self, quantum: float = 1 / 1024):
+        self.quantum = quantum
+        self.latents = None
+        self.kv = None
+        self.keys = None
+        self.values = None
+
+    def bind(self, latents: torch.Tensor, geo_decoder: CrossAttentionDecoder):
+        if self.latents is not latents:
+            self.latents = latents
+            self.kv = geo_decoder.project_latents(latents)
+            self.keys = torch.empty(0, dtype=torch.long, device=latents.device)
+            self.values = torch.empty((0, latents.shape[0]), dtype=torch.float32, device=latents.device)
+
+    def __len__(self):
+        return 0 if self.keys is None else self.keys.shape[0]
+
+    def quantize(self, points: torch.Tensor) -> Tuple[torch.LongTensor, torch.BoolTensor]:
+        """Keys of the quantization cells of `points` [N, 3], and which points are in the cacheable range."""
+        offset = 1 << (self.bits - 1)
+        cells = torch.round(points.double() / self.quantum).long() + offset
+        valid = ((cells >= 0) & (cells < 1 << self.bits)).all(dim=-1)
+        cells = cells.clamp(0, (1 << self.bits) - 1)
+        return (cells[:, 0] << (2 * self.bits)) | (cells[:, 1] << self.bits) | cells[:, 2], valid
+
+    def cell_centers(self, keys: torch.LongTensor) -> torch.Tensor:
+        mask = (1 << self.bits) - 1
+        cells = torch.stack((keys >> (2 * self.bits), (keys >> self.bits) & mask, keys & mask), dim=-1)
+        return ((cells - (1 << (self.bits - 1))).double() * self.quantum).float()
+
+    def lookup(self, keys: torch.LongTensor) -> Tuple[torch.Tensor, torch.BoolTensor]:
+        """Values [N, B] at `keys` and which of them are cached. Missing entries hold arbitrary values."""
+        if len(self) == 0:
+            return (self.values.new_zeros((keys.shape[0], self.values.shape[1])),
+                    torch.zeros(keys.shape, dtype=torch.bool, device=keys.device))
+        pos = torch.searchsorted(self.keys, keys).clamp_(max=len(self) - 1)
+        return self.values[pos], self.keys[pos] == keys
+
+    def insert(self, keys: torch.LongTensor, values: torch.Tensor):
+        """Add `keys` (not cached yet) and their values [N, B]."""
+        self.keys, order = torch.sort(torch.cat([self.keys, keys]))
+        self.values = torch.cat([self.values, values])[order]
+
+
+class PointOccupancyDecoder:
+    """
+    Occupancy logits at arbitrary points, decoded in chunks of `num_chunks` points so memory stays bounded and
+    the cost follows the number of points asked for. Points are read chunk by chunk, so memory-mapped arrays
+    are never loaded as a whole.
+    """
+
+    @torch.no_grad()
+    def __call__(
+        self,
+        latents: torch.FloatTensor,
+        geo_decoder: CrossAttentionDecoder,
+        points: Union[torch.Tensor, np.ndarray, str, os.PathLike],
+        num_chunks: int = 10000,
+        cache: OccupancyCache = None,
+        enable_pbar: bool = False,
+        **kwargs,
+    ) -> Union[torch.Tensor, np.ndarray]:
+        """
+        Args:
+            points: [N, 3] points in model coordinates, shared by every sample of `latents`. A tensor, a NumPy
+                array (`np.memmap` included) or the path of a `.npy` file, which is memory-mapped.
+            cache: optional `OccupancyCache`, reused across calls with the same latents.
+
+        Returns:
+            float32 logits [B, N], a NumPy array for NumPy and file inputs, else a tensor on the device of
+            `latents`.
+        """
+        if isinstance(points, (str, os.PathLike)):
+            points = np.load(points, mmap_mode='r')
+        as_numpy = isinstance(points, np.ndarray)
+        device = latents.device
+        batch_size, num_points = latents.shape[0], points.shape[0]
+
+        kv = None
+        if cache is not None:
+            cache.bind(latents, geo_decoder)
+            kv = cache.kv
+        if as_numpy:
+            outputs = np.empty((batch_size, num_points), dtype=np.float32)
+        else:
+            outputs = torch.empty((batch_size, num_points), dtype=torch.float32, device=device)
+
+        with geo_decoder.cache_latents(latents, kv=kv):
+            for start in tqdm(range(0, num_points, num_chunks), desc="Point Queries", disable=not enable_pbar):
+                chunk = points[start:start + num_chunks]
+                if as_numpy:
+                    chunk = torch.from_numpy(np.ascontiguousarray(chunk, dtype=np.float32))
+                chunk = chunk.to(device, dtype=torch.float32)
+                if cache is None:
+                    logits = self.decode(latents, geo_decoder, chunk)
+                else:
+                    logits = self.decode_cached(latents, geo_decoder, chunk, cache)
+                outputs[:, start:start + chunk.shape[0]] = logits.cpu().numpy() if as_numpy else logits
+        return outputs
+
+    @staticmethod
+    def decode(latents: torch.FloatTensor, geo_decoder: CrossAttentionDecoder, points: torch.Tensor):
+        """Logits [B, N] of `points` [N, 3]."""
+        query_embeddings = geo_decoder.query_proj(geo_decoder.fourier_embedder(points).to(latents.dtype))
+        query_embeddings = repeat(query_embeddings, "p c -> b p c", b=latents.shape[0])
+        return geo_decoder(query_embeddings=query_embeddings, latents=latents)[..., 0].float()
+
+    def decode_cached(self, latents, geo_decoder, points: torch.Tensor, cache: OccupancyCache):
+        keys, valid = cache.quantize(points)
+        logits = torch.empty((latents.shape[0], points.shape[0]), dtype=torch.float32, device=points.device)
+        if not valid.all():
+            logits[:, ~valid] = self.decode(latents, geo_decoder, points[~valid])
+
+        # every quantization cell is decoded once, at its center
+        cells, inverse = torch.unique(keys[valid], return_inverse=True)
+        values, found = cache.lookup(cells)
+        if not found.all():
+            new_cells = cells[~found]
+            new_values = self.decode(latents, geo_decoder, cache.cell_centers(new_cells)).T
+            values[~found] = new_values
+            cache.insert(new_cells, new_values)
+        logits[:, valid] = values[inverse].T
+        return logits
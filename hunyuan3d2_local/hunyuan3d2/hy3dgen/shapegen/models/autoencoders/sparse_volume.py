@@ -0,0 +1,208 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+from typing import Optional, Tuple
+
+import torch
+
+
+def encode_keys(index: torch.LongTensor, grid_size: int) -> torch.LongTensor:
+    """Linear C-order keys of integer coordinates `index` [N, 3] in a cubic grid with `grid_size` points per axis."""
+    return (index[:, 0] * grid_size + index[:, 1]) * grid_size + index[:, 2]
+
+
+def decode_keys(keys: torch.LongTensor, grid_size: int) -> torch.LongTensor:
+    """Inverse of `encode_keys`, returns coordinates of shape [N, 3]."""
+    return torch.stack((keys // (grid_size * grid_size), keys // grid_size % grid_size, keys % grid_size), dim=-1)
+
+
+def dilate_keys(keys: torch.LongTensor, radius: int, grid_size: int) -> torch.LongTensor:
+    """
+    Grow a set of grid keys by a (2 * radius + 1)^3 cube, clipped to the grid. This is the sparse equivalent of
+    thresholding a 3x3x3 ones-convolution `radius` times. The cube is applied one axis at a time, so the temporary
+    memory is (2 * radius + 1) times the set size instead of (2 * radius + 1)^3 times.
+
+    Returns:
+        the dilated keys, sorted and unique.
+    """
+    if radius == 0:
+        return torch.unique(keys)
+    for stride in (grid_size * grid_size, grid_size, 1):
+        coord = keys // stride % grid_size
+        candidates = []
+        for offset in range(-radius, radius + 1):
+            inside = (coord + offset >= 0) & (coord + offset < grid_size)
+            candidates.append(keys[inside] + offset * stride)
+        keys = torch.unique(torch.cat(candidates))
+    return keys
+
+
+class SparseVolume:
+    """
+    Narrow-band storage of a cubic grid with `resolution + 1` points per axis.
+
+    Only evaluated points are kept, as sorted linear keys (see `encode_keys`) and their values. `lookup` hashes
+    coordinates through a binary search on the keys, so memory and neighbour queries scale with the number of
+    stored points (roughly the surface area) instead of the grid volume. Points that are not stored read as
+    `fill_value`.
+    """
+
+    def __init__(
+        self,
+        keys: torch.LongTensor,
+        values: torch.Tensor,
+        resolution: int,
+        fill_value: float = float('nan'),
+    ):
+        self.keys = keys
+        self.values = values
+        self.resolution = int(resolution)
+        self.fill_value = fill_value
+
+    @classmethod
+    def from_dense(cls, grid: torch.Tensor, mask: Optional[torch.Tensor] = None, fill_value: float = float('nan')):
+        """Keep the points of a dense [n, n, n] grid where `mask` is set, or all of them if `mask` is None."""
+        values = grid.reshape(-1)
+        if mask is None:
+            keys = torch.arange(values.shape[0], device=grid.device)
+        else:
+            keys = torch.nonzero(mask.reshape(-1)).squeeze(-1)
+            values = values[keys]
+        return cls(keys, values, grid.shape[0] - 1, fill_value=fill_value)
+
+    @property
+    def grid_size(self) -> int:
+        return self.resolution + 1
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self.grid_size,) * 3
+
+    @property
+    def device(self):
+        return self.values.device
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def index(self) -> torch.LongTensor:
+        """Coordinates of the stored points, [N, 3]."""
+        return decode_keys(self.keys, self.grid_size)
+
+    def lookup(self, keys: torch.LongTensor) -> Tuple[torch.Tensor, torch.BoolTensor]:
+        """Values at `keys` and a mask of which of them are stored. Missing entries hold arbitrary values."""
+        if len(self) == 0:
+            return (torch.full(keys.shape, self.fill_value, dtype=self.dtype, device=self.device),
+                    torch.zeros(keys.shape, dtype=torch.bool, device=self.device))
+        pos = torch.searchsorted(self.keys, keys).clamp_(max=len(self) - 1)
+        return self.values[pos], self.keys[pos] == keys
+
+    def active_blocks(self, block_size: int) -> torch.LongTensor:
+        """Coordinates of the `block_size`^3 blocks that hold at least one stored point, [M, 3]."""
+        return torch.unique(self.index() // block_size, dim=0)
+
+    def to_dense(self, fill_value: Optional[float] = None) -> torch.Tensor:
+        fill_value = self.fill_value if fill_value is None else fill_value
+        grid = torch.full((self.grid_size ** 3,), fill_value, dtype=self.dtype, device=self.device)
+        grid[self.keys] = self.values
+        return grid.view(self.shape)
+
+    def to(self, device=None, dtype=None):
+        return SparseVolume(self.keys.to(device), self.values.to(device, dtype=dtype), self.resolution,
+                            fill_value=self.fill_value)
+
+    def __repr__(self):
+        return f'SparseVolume(resolution={self.resolution}, points={len(self)}, dtype={self.dtype})'
+
+
+def extract_near_surface_keys(volume: SparseVolume, alpha: float) -> torch.LongTensor:
+    """
+    Sparse counterpart of `extract_near_surface_volume_fn(grid, alpha) | (grid.abs() < 0.95)`: the keys of stored
+    points whose sign (after adding `alpha`) differs from one of their stored, valid face neighbours, or whose
+    value is close to the decision boundary. Like the dense version, every pair of neighbours is looked up once
+    (from its lower end) and both ends are marked.
+    """
+    keys, grid_size = volume.keys, volume.grid_size
+    if len(volume) == 0:
+        return keys
+    val = volume.values + alpha
+    sign = torch.sign(val)
+    valid = val > -9000
+    mask = volume.values.abs() < 0.95
+    for stride in (grid_size * grid_size, grid_size, 1):
+        neighbor_keys = keys + stride
+        pos = torch.searchsorted(keys, neighbor_keys).clamp_(max=len(volume) - 1)
+        pair = (keys // stride % grid_size + 1 < grid_size) & (keys[pos] == neighbor_keys) & (sign[pos] != sign)
+        mask |= pair & valid[pos]
+        mask[pos[pair & valid]] = True
+    return keys[mask]
+
+
+def extract_surface_blocks(volume: SparseVolume, level: float, block_size: int) -> Tuple[torch.LongTensor, torch.Tensor]:
+    """
+    Gather the blocks of `block_size`^3 cells that hold stored, finite points on both sides of `level`, the only
+    ones the surface can cross. Block (i, j, k) covers the points (i, j, k) * block_size up to
+    (i, j, k) * block_size + block_size, so points on block boundaries belong to several blocks.
+
+    Returns:
+        the block origins [M, 3] in grid coordinates and the values of their points [M, n, n, n] with
+        n = block_size + 1, NaN where nothing is stored.
+    """
+    num_blocks = -(-volume.resolution // block_size)
+    # blocks are addressed on a (num_blocks + 1)^3 grid, the extra layer catches points on the last grid plane
+    grid_blocks = num_blocks + 1
+    n = block_size + 1
+    index, values = volume.index(), volume.values
+    finite = torch.isfinite(values)
+    if not finite.all():
+        index, values = index[finite], values[finite]
+
+    # all (block, local point) pairs of every point: its own block, plus the blocks below along the axes where it
+    # sits on a lower block boundary
+    block, local = index // block_size, index % block_size
+    on_boundary = (local == 0) & (index > 0)
+    block_ids = (block[:, 0] * grid_blocks + block[:, 1]) * grid_blocks + block[:, 2]
+    local_ids = (local[:, 0] * n + local[:, 1]) * n + local[:, 2]
+    boundary_ids = torch.nonzero(on_boundary.any(dim=-1)).squeeze(-1)
+    point_list, block_list, local_list = [torch.arange(len(index), device=volume.device)], [block_ids], [local_ids]
+    for shift in torch.cartesian_prod(*[torch.tensor([0, 1], device=volume.device)] * 3)[1:]:
+        point_ids = boundary_ids[(on_boundary[boundary_ids] | (shift == 0)).all(dim=-1)]
+        block_shift = (shift[0] * grid_blocks + shift[1]) * grid_blocks + shift[2]
+        local_shift = ((shift[0] * n + shift[1]) * n + shift[2]) * block_size
+        point_list.append(point_ids)
+        block_list.append(block_ids[point_ids] - block_shift)
+        local_list.append(local_ids[point_ids] + local_shift)
+    point_ids, block_ids, local_ids = torch.cat(point_list), torch.cat(block_list), torch.cat(local_list)
+
+    above = values[point_ids] > level
+    any_above = torch.zeros(grid_blocks ** 3, dtype=torch.bool, device=volume.device)
+    any_below = torch.zeros(grid_blocks ** 3, dtype=torch.bool, device=volume.device)
+    any_above[block_ids[above]] = True
+    any_below[block_ids[~above]] = True
+    selected = torch.nonzero(any_above & any_below).squeeze(-1)
+    origins = decode_keys(selected, grid_blocks)
+    selected_inside = (origins < num_blocks).all(dim=-1)
+    selected, origins = selected[selected_inside], origins[selected_inside] * block_size
+
+    slot = torch.full((grid_blocks ** 3,), -1, dtype=torch.long, device=volume.device)
+    slot[selected] = torch.arange(len(selected), device=volume.device)
+    slots = slot[block_ids]
+    keep = slots >= 0
+    blocks = torch.full((len(selected) * n ** 3,), float('nan'), dtype=values.dtype, device=volume.device)
+    blocks[slots[keep] * n ** 3 + local_ids[keep]] = values[point_ids[keep]]
+    return origins, blocks.view(-1, n, n, n)
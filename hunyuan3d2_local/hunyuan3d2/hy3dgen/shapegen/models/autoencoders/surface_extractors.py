@@ -12,12 +12,19 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
-from typing import Union, Tuple, List
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union, Tuple, List, Optional
 
 import numpy as np
 import torch
+import torch.nn.functional as F
 from skimage import measure
 
+from ....marching_cubes import marching_cubes_block
+from .sparse_volume import SparseVolume, decode_keys, encode_keys, extract_surface_blocks
+
 
 class Latent2MeshOutput:
 
@@ -35,6 +42,9 @@ def center_vertices(vertices):
 
 
 class SurfaceExtractor:
+    # extractors that consume `SparseVolume` directly, the others get a dense grid
+    supports_sparse = False
+
     def _compute_box_stat(self, bounds: Union[Tuple[float], List[float], float], octree_resolution: int):
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
@@ -48,10 +58,14 @@ class SurfaceExtractor:
         return NotImplementedError
 
     def __call__(self, grid_logits, **kwargs):
+        """`grid_logits` is a dense [B, D, H, W] tensor or a list of `SparseVolume`, one per sample."""
         outputs = []
-        for i in range(grid_logits.shape[0]):
+        for i in range(len(grid_logits)):
             try:
-                vertices, faces = self.run(grid_logits[i], **kwargs)
+                grid_logit = grid_logits[i]
+                if isinstance(grid_logit, SparseVolume) and not self.supports_sparse:
+                    grid_logit = grid_logit.to_dense()
+                vertices, faces = self.run(grid_logit, **kwargs)
                 vertices = vertices.astype(np.float32)
                 faces = np.ascontiguousarray(faces)
                 outputs.append(Latent2MeshOutput(mesh_v=vertices, mesh_f=faces))
@@ -65,12 +79,344 @@ class SurfaceExtractor:
 
 
 class MCSurfaceExtractor(SurfaceExtractor):
-    def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+    def marching_cubes(self, volume: np.ndarray, level: float):
         vertices, faces, normals, _ = measure.marching_cubes(
-            grid_logit.cpu().numpy(),
-            mc_level,
+            volume,
+            level,
             method="lewiner"
         )
+        return vertices, faces
+
+    def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+        vertices, faces = self.marching_cubes(grid_logit.cpu().numpy(), mc_level)
+        grid_size, bbox_min, bbox_size = self._compute_box_stat(bounds, octree_resolution)
+        vertices = vertices / grid_size * bbox_size + bbox_min
+        return vertices, faces
+
+
+def _is_clean_seam(plane: np.ndarray, level: float) -> bool:
+    """
+    True if no vertex on the edges of `plane` lands on (or rounds to) a grid point, where vertices of edges in
+    different directions would share a position.
+    """
+    if (plane == level).any():
+        return False
+    plane = plane.astype(np.float64)
+    for v0, v1 in ((plane[:-1], plane[1:]), (plane[:, :-1], plane[:, 1:])):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (level - v0) / (v1 - v0)
+        if ((t >= 0) & (t <= 1) & ((t < 1e-3) | (t > 1 - 1e-3))).any():
+            return False
+    return True
+
+
+class BlockMCSurfaceExtractor(MCSurfaceExtractor):
+    """
+    Marching cubes over slabs of the grid on a process pool (the skimage kernel holds the GIL, so threads would
+    not help).
+
+    The grid is cut along its first axis into about `num_blocks` slabs that share their boundary plane. skimage
+    walks the cubes with the first axis outermost, so concatenating the slabs in order reproduces the monolithic
+    vertex and face order once the vertices of every shared plane are taken from the slab below it, and the
+    positions on first-axis edges are re-interpolated in global coordinates. Seams are only placed on planes where
+    no vertex sits on a grid point, so shared vertices are matched exactly by position.
+
+    The output matches `MCSurfaceExtractor` face for face, up to rare one-ulp float32 rounding ties in vertex
+    positions. The only exception are the all-NaN vertices skimage emits next to NaN (not decoded) grid points,
+    which are never shared across slabs; `trimesh` drops them together with their faces either way.
+
+    The `num_workers` processes (by default the CPU count, at most `max_default_workers`) are started on the first
+    call and kept until `close()`. They come from a fork server (spawned where there is none, e.g. on Windows)
+    and unpickle the kernel from `hy3dgen.marching_cubes`, which only needs numpy and skimage. Both start methods
+    import the main module of the program outside of `__main__`: scripts using this extractor need an
+    `if __name__ == '__main__':` guard, and their top-level imports are paid once by the fork server (once per
+    worker when spawned).
+    """
+    # a slab takes milliseconds, more workers mostly add startup time and memory
+    max_default_workers = 8
+
+    def __init__(self, num_workers: Optional[int] = None, num_blocks: Optional[int] = None):
+        self.num_workers = num_workers or min(os.cpu_count() or 1, self.max_default_workers)
+        # a few slabs per worker, the surface is rarely spread evenly along the axis
+        self.num_blocks = num_blocks or 4 * self.num_workers
+        self.pool = None
+
+    def close(self):
+        """Shut the process pool down, a later call starts a new one."""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def __del__(self):
+        self.close()
+
+    def marching_cubes(self, volume: np.ndarray, level: float):
+        volume = np.ascontiguousarray(volume, np.float32)
+        level = float(level)
+        size = volume.shape[0] - 1
+        spacing = max(size / self.num_blocks, 1)
+        bounds = [0]
+        # move every seam to the closest plane whose vertices can be matched exactly, or drop it
+        for target in np.arange(spacing, size - 0.5, spacing).round().astype(np.int64):
+            for offset in range(int(spacing) // 2 + 1):
+                candidates = [k for k in (target - offset, target + offset) if bounds[-1] < k < size]
+                seam = next((k for k in candidates if _is_clean_seam(volume[k], level)), None)
+                if seam is not None:
+                    bounds.append(seam)
+                    break
+        bounds.append(size)
+        if len(bounds) <= 2:
+            return super().marching_cubes(volume, level)
+
+        blocks = [volume[start:stop + 1] for start, stop in zip(bounds[:-1], bounds[1:])]
+        if self.num_workers > 1:
+            if self.pool is None:
+                # not forked from this process, which holds torch's thread pools and, in the API server, running
+                # threads; the fork server imports the main module once, spawned workers would import it each
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self.pool = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                mp_context=multiprocessing.get_context(method))
+            results = self.pool.map(marching_cubes_block, blocks, [level] * len(blocks))
+        else:
+            results = map(marching_cubes_block, blocks, [level] * len(blocks))
+
+        vertices_list, faces_list = [], []
+        num_vertices = 0
+        seam_keys = seam_index = np.empty(0, dtype=np.int64)
+        for start, stop, result in zip(bounds[:-1], bounds[1:], results):
+            if result is None:
+                seam_keys = seam_index = np.empty(0, dtype=np.int64)
+                continue
+            vertices, faces = result
+            # the in-plane coordinates are computed identically on both sides of a seam, use their bits as keys
+            keys = np.ascontiguousarray(vertices[:, 1:]).view(np.int64).reshape(-1)
+
+            index = np.empty(len(vertices), dtype=np.int64)
+            shared = vertices[:, 0] == 0
+            if len(seam_keys) > 0 and shared.any():
+                pos = np.searchsorted(seam_keys, keys[shared]).clip(max=len(seam_keys) - 1)
+                found = seam_keys[pos] == keys[shared]
+                shared[shared] = found
+                index[shared] = seam_index[pos[found]]
+            else:
+                shared[:] = False
+            kept = ~shared
+            index[kept] = np.arange(num_vertices, num_vertices + kept.sum())
+            num_vertices += kept.sum()
+
+            vertices = vertices[kept]
+            fractional = vertices != np.floor(vertices)
+            on_edge = fractional[:, 0] & ~fractional[:, 1] & ~fractional[:, 2]
+            coord = vertices[:, 0]
+            coord[~on_edge] += start
+            # skimage rounds positions to float32 from the global index, redo the interpolation on first-axis edges
+            x = np.floor(coord[on_edge]).astype(np.int64) + start
+            y, z = vertices[on_edge, 1].astype(np.int64), vertices[on_edge, 2].astype(np.int64)
+            v0, v1 = volume[x, y, z].astype(np.float64), volume[x + 1, y, z].astype(np.float64)
+            coord[on_edge] = x + (level - v0) / (v1 - v0)
+
+            vertices_list.append(vertices)
+            faces_list.append(index[faces])
+
+            top = np.nonzero(result[0][:, 0] == stop - start)[0]
+            order = np.argsort(keys[top], kind='stable')
+            seam_keys, seam_index = keys[top][order], index[top][order]
+
+        if num_vertices == 0:
+            raise RuntimeError('No surface found at the given iso value.')
+        vertices = np.concatenate(vertices_list)
+        faces = np.concatenate(faces_list).astype(faces.dtype)
+        return vertices, faces
+
+
+class SparseMCSurfaceExtractor(MCSurfaceExtractor):
+    """
+    Marching cubes on the `block_size`^3 blocks of cells that hold a surface crossing only, so the cost follows the
+    surface size instead of the grid volume. Consumes the `SparseVolume` of the hierarchical decoders without
+    densifying it; dense grids get their blocks from pooled extrema.
+
+    Blocks share their boundary points, vertices on block boundaries are merged by the grid edge they lie on.
+    Cells next to points that were not decoded (NaN) do not produce faces.
+    """
+    supports_sparse = True
+
+    def __init__(self, block_size: int = 16):
+        self.block_size = block_size
+
+    def surface_blocks(self, grid_logit, level: float):
+        """Origins [M, 3] and point values [M, n, n, n] of the blocks the surface can cross."""
+        if isinstance(grid_logit, SparseVolume):
+            return extract_surface_blocks(grid_logit, level, self.block_size)
+        # finite extrema over the points of every block, blocks overlap by one point
+        grid = grid_logit.float()[None, None]
+        pool = dict(kernel_size=self.block_size + 1, stride=self.block_size, ceil_mode=True)
+        high = F.max_pool3d(torch.nan_to_num(grid, nan=-float('inf')), **pool)
+        low = -F.max_pool3d(torch.nan_to_num(-grid, nan=-float('inf')), **pool)
+        origins = torch.nonzero((high[0, 0] > level) & (low[0, 0] <= level)) * self.block_size
+
+        n = self.block_size + 1
+        offsets = torch.stack(torch.meshgrid(*[torch.arange(n, device=origins.device)] * 3, indexing='ij'), dim=-1)
+        index = origins[:, None, None, None] + offsets
+        inside = (index < grid_logit.shape[0]).all(dim=-1)
+        index = index.clamp(max=grid_logit.shape[0] - 1)
+        values = grid_logit[index[..., 0], index[..., 1], index[..., 2]]
+        return origins, torch.where(inside, values, torch.full_like(values, float('nan')))
+
+    def marching_cubes(self, grid_logit, level: float):
+        level = float(level)
+        grid_size = grid_logit.shape[0]
+        origins, values = self.surface_blocks(grid_logit, level)
+        origins, values = origins.cpu().numpy(), values.to(torch.float32).cpu().numpy()
+
+        vertices_list, faces_list, keys_list = [], [], []
+        num_vertices = 0
+        for origin, volume in zip(origins, values):
+            result = marching_cubes_block(volume, level)
+            if result is None:
+                continue
+            vertices, faces = result
+            # drop the vertices and faces coming from NaN corners
+            finite = np.isfinite(vertices).all(axis=-1)
+            faces = faces[finite[faces].all(axis=-1)]
+            used = np.zeros(len(vertices), dtype=bool)
+            used[faces] = True
+            vertices = vertices[used]
+            faces = (np.cumsum(used) - 1)[faces]
+
+            # vertices on a block boundary are keyed by their grid edge: lower end point and direction
+            fractional = vertices != np.floor(vertices)
+            on_boundary = ((vertices == 0) | (vertices == self.block_size)).any(axis=-1)
+            on_boundary &= fractional.sum(axis=-1) <= 1
+            points = np.floor(vertices).astype(np.int64) + origin
+            direction = np.where(fractional.any(axis=-1), fractional.argmax(axis=-1), 3)
+            keys = ((points[:, 0] * grid_size + points[:, 1]) * grid_size + points[:, 2]) * 4 + direction
+            keys = np.where(on_boundary, keys, -1 - np.arange(num_vertices, num_vertices + len(vertices)))
+
+            vertices_list.append(vertices + origin)
+            faces_list.append(faces + num_vertices)
+            keys_list.append(keys)
+            num_vertices += len(vertices)
+
+        if num_vertices == 0:
+            raise RuntimeError('No surface found at the given iso value.')
+        vertices = np.concatenate(vertices_list)
+        faces = np.concatenate(faces_list)
+        # merge the shared vertices, keeping the first occurrence
+        _, first, inverse = np.unique(np.concatenate(keys_list), return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        vertices = vertices[first[order]]
+        faces = rank[inverse.reshape(-1)][faces].astype(np.int32)
+        return vertices, faces
+
+    def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+        vertices, faces = self.marching_cubes(grid_logit, mc_level)
+        grid_size, bbox_min, bbox_size = self._compute_box_stat(bounds, octree_resolution)
+        vertices = vertices / grid_size * bbox_size + bbox_min
+        return vertices, faces
+
+
+class DualMCSurfaceExtractor(SurfaceExtractor):
+    """
+    Dual marching cubes in plain PyTorch, for machines without the CUDA `diso` kernels of `DMCSurfaceExtractor`.
+
+    Every cell the surface crosses gets one vertex, at the mean of the crossings on its edges (the surface nets
+    flavour of dual contouring), and every crossed grid edge gets one quad joining the vertices of its four cells.
+    Quads are split along their shorter diagonal unless `return_quads` is set. Triangulated, the mesh has about as
+    many faces as the marching cubes one but without its slivers; the quad mesh has half as many faces.
+
+    Works on dense grids and `SparseVolume` alike, on the device of the input. Edges touching NaN (not decoded)
+    points are skipped.
+    """
+    supports_sparse = True
+
+    def __init__(self, return_quads: bool = False):
+        self.return_quads = return_quads
+
+    @staticmethod
+    def edge_crossings(grid_logit, level: float):
+        """
+        For every axis, the lower end points [E, 3] of the grid edges along it that the surface crosses, the
+        crossing offsets along the edges and whether the lower end points are inside.
+        """
+        outputs = []
+        if isinstance(grid_logit, SparseVolume):
+            keys, grid_size = grid_logit.keys, grid_logit.grid_size
+            v0 = grid_logit.values.float()
+            for axis in range(3):
+                stride = grid_size ** (2 - axis)
+                v1, found = grid_logit.lookup(keys + stride)
+                v1 = v1.float()
+                # comparisons with NaN are false on both sides
+                crossing = ((v0 > level) & (v1 <= level)) | ((v0 <= level) & (v1 > level))
+                crossing &= found & (keys // stride % grid_size + 1 < grid_size)
+                outputs.append((decode_keys(keys[crossing], grid_size), v0[crossing], v1[crossing]))
+        else:
+            above, below = grid_logit > level, grid_logit <= level
+            for axis in range(3):
+                size = grid_logit.shape[axis] - 1
+                crossing = above.narrow(axis, 0, size) & below.narrow(axis, 1, size)
+                crossing |= below.narrow(axis, 0, size) & above.narrow(axis, 1, size)
+                index = torch.nonzero(crossing)
+                v0 = grid_logit[index[:, 0], index[:, 1], index[:, 2]].float()
+                index[:, axis] += 1
+                v1 = grid_logit[index[:, 0], index[:, 1], index[:, 2]].float()
+                index[:, axis] -= 1
+                outputs.append((index, v0, v1))
+        return [(index, (level - v0) / (v1 - v0), v0 > level) for index, v0, v1 in outputs]
+
+    def dual_contour(self, grid_logit, level: float):
+        resolution = grid_logit.resolution if isinstance(grid_logit, SparseVolume) else grid_logit.shape[0] - 1
+        device = grid_logit.device
+        corners = torch.tensor([[0, 0], [1, 0], [1, 1], [0, 1]], device=device)
+
+        points_list, cells_list, flips = [], [], []
+        for axis, (index, t, inside) in enumerate(self.edge_crossings(grid_logit, level)):
+            points = index.float()
+            points[:, axis] += t
+            # the four cells around the edge, counterclockwise around `axis`
+            plane_axes = [(axis + 1) % 3, (axis + 2) % 3]
+            cells = index[:, None].repeat(1, 4, 1)
+            cells[..., plane_axes] -= corners
+            points_list.append(points)
+            cells_list.append(cells)
+            flips.append(inside)
+        points, cells, flip = torch.cat(points_list), torch.cat(cells_list), torch.cat(flips)
+        if len(points) == 0:
+            raise RuntimeError('No surface found at the given iso value.')
+
+        # one vertex per cell, at the mean of the crossings on its edges
+        valid = ((cells >= 0) & (cells < resolution)).all(dim=-1)
+        keys = torch.where(valid, encode_keys(cells.view(-1, 3), resolution).view(-1, 4), -1)
+        cell_keys, inverse = torch.unique(keys.view(-1), return_inverse=True)
+        inverse = inverse.view(-1, 4)
+        vertices = torch.zeros((len(cell_keys), 3), device=device)
+        vertices.index_add_(0, inverse.view(-1), points[:, None].expand(-1, 4, -1).reshape(-1, 3))
+        counts = torch.bincount(inverse.view(-1), minlength=len(cell_keys))
+        vertices /= counts[:, None]
+        if cell_keys[0] == -1:
+            vertices, inverse = vertices[1:], inverse - 1
+
+        # quads of the edges inside the grid, wound like skimage's marching cubes
+        quads = inverse[valid.all(dim=-1)]
+        flip = flip[valid.all(dim=-1)]
+        quads[flip] = quads[flip].flip(-1)
+        if self.return_quads:
+            return vertices, quads
+        quad_vertices = vertices[quads]
+        diagonal02 = (quad_vertices[:, 0] - quad_vertices[:, 2]).square().sum(-1)
+        diagonal13 = (quad_vertices[:, 1] - quad_vertices[:, 3]).square().sum(-1)
+        split = (diagonal02 <= diagonal13)[:, None]
+        faces = torch.cat([
+            torch.where(split, quads[:, [0, 1, 2]], quads[:, [0, 1, 3]]),
+            torch.where(split, quads[:, [0, 2, 3]], quads[:, [1, 2, 3]]),
+        ])
+        return vertices, faces
+
+    def run(self, grid_logit, *, mc_level, bounds, octree_resolution, **kwargs):
+        vertices, faces = self.dual_contour(grid_logit, mc_level)
+        vertices, faces = vertices.cpu().numpy(), faces.to(torch.int32).cpu().numpy()
         grid_size, bbox_min, bbox_size = self._compute_box_stat(bounds, octree_resolution)
         vertices = vertices / grid_size * bbox_size + bbox_min
         return vertices, faces
@@ -96,5 +442,8 @@ class DMCSurfaceExtractor(SurfaceExtractor):
 
 SurfaceExtractors = {
     'mc': MCSurfaceExtractor,
+    'block_mc': BlockMCSurfaceExtractor,
+    'sparse_mc': SparseMCSurfaceExtractor,
     'dmc': DMCSurfaceExtractor,
+    'dual_mc': DualMCSurfaceExtractor,
 }
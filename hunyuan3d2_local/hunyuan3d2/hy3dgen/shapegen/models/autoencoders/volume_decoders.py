@@ -12,111 +12,77 @@
 # fine-tuning enabling code and other elements of the foregoing made publicly available
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
+from bisect import bisect_left
+from itertools import accumulate
 from typing import Union, Tuple, List, Callable
 
 import numpy as np
 import torch
-import torch.nn as nn
 import torch.nn.functional as F
 from einops import repeat
+from torch.nn.utils.rnn import pad_sequence
 from tqdm import tqdm
 
 from .attention_blocks import CrossAttentionDecoder
 from .attention_processors import FlashVDMCrossAttentionProcessor, FlashVDMTopMCrossAttentionProcessor
+from .sparse_volume import SparseVolume, decode_keys, dilate_keys, encode_keys, extract_near_surface_keys
 from ...utils import logger
 
 
-def extract_near_surface_volume_fn(input_tensor: torch.Tensor, alpha: float):
+def extract_near_surface_volume_fn(input_tensor: torch.Tensor, alpha: float, slab_points: int = 1 << 22):
+    """
+    Mask of the grid points whose sign (after adding `alpha`) differs from one of their face neighbours. Values
+    <= -9000 (and NaN) are invalid: such points are never selected and never count as a neighbour.
+
+    A sign change is symmetric, so every pair of neighbours is compared once and both ends are marked. The grid
+    is walked in slabs of about `slab_points` points along the first axis, so besides the int8 signs, the
+    validity and the returned mask, temporaries are slab sized.
+
+    Returns:
+        a bool tensor of the shape of `input_tensor`.
+    """
+    shape = input_tensor.shape
     device = input_tensor.device
-    D = input_tensor.shape[0]
-    signed_val = 0.0
-
-    # 添加偏移并处理无效值
-    val = input_tensor + alpha
-    valid_mask = val > -9000  # 假设-9000是无效值
-
-    # 改进的邻居获取函数（保持维度一致）
-    def get_neighbor(t, shift, axis):
-        """根据指定轴进行位移并保持维度一致"""
-        if shift == 0:
-            return t.clone()
-
-        # 确定填充轴（输入为[D, D, D]对应z,y,x轴）
-        pad_dims = [0, 0, 0, 0, 0, 0]  # 格式：[x前，x后，y前，y后，z前，z后]
-
-        # 根据轴类型设置填充
-        if axis == 0:  # x轴（最后一个维度）
-            pad_idx = 0 if shift > 0 else 1
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 1:  # y轴（中间维度）
-            pad_idx = 2 if shift > 0 else 3
-            pad_dims[pad_idx] = abs(shift)
-        elif axis == 2:  # z轴（第一个维度）
-            pad_idx = 4 if shift > 0 else 5
-            pad_dims[pad_idx] = abs(shift)
-
-        # 执行填充（添加batch和channel维度适配F.pad）
-        padded = F.pad(t.unsqueeze(0).unsqueeze(0), pad_dims[::-1], mode='replicate')  # 反转顺序适配F.pad
-
-        # 构建动态切片索引
-        slice_dims = [slice(None)] * 3  # 初始化为全切片
-        if axis == 0:  # x轴（dim=2）
-            if shift > 0:
-                slice_dims[0] = slice(shift, None)
-            else:
-                slice_dims[0] = slice(None, shift)
-        elif axis == 1:  # y轴（dim=1）
-            if shift > 0:
-                slice_dims[1] = slice(shift, None)
+    slab = max(1, slab_points // (shape[1] * shape[2]))
+
+    sign = torch.empty(shape, dtype=torch.int8, device=device)
+    valid = torch.empty(shape, dtype=torch.bool, device=device)
+    for start in range(0, shape[0], slab):
+        val = input_tensor[start:start + slab] + alpha
+        sign[start:start + slab] = torch.sign(val)
+        torch.gt(val, -9000, out=valid[start:start + slab])
+
+    mask = torch.zeros(shape, dtype=torch.bool, device=device)
+    for start in range(0, shape[0], slab):
+        end = min(start + slab, shape[0])
+        for axis in range(3):
+            head = [slice(start, end), slice(None), slice(None)]
+            tail = list(head)
+            if axis == 0:
+                # pairs across the slab boundary belong to the lower slab
+                head[0] = slice(start, min(end, shape[0] - 1))
+                tail[0] = slice(start + 1, min(end, shape[0] - 1) + 1)
             else:
-                slice_dims[1] = slice(None, shift)
-        elif axis == 2:  # z轴（dim=0）
-            if shift > 0:
-                slice_dims[2] = slice(shift, None)
-            else:
-                slice_dims[2] = slice(None, shift)
-
-        # 应用切片并恢复维度
-        padded = padded.squeeze(0).squeeze(0)
-        sliced = padded[slice_dims]
-        return sliced
-
-    # 获取各方向邻居（确保维度一致）
-    left = get_neighbor(val, 1, axis=0)  # x方向
-    right = get_neighbor(val, -1, axis=0)
-    back = get_neighbor(val, 1, axis=1)  # y方向
-    front = get_neighbor(val, -1, axis=1)
-    down = get_neighbor(val, 1, axis=2)  # z方向
-    up = get_neighbor(val, -1, axis=2)
-
-    # 处理边界无效值（使用where保持维度一致）
-    def safe_where(neighbor):
-        return torch.where(neighbor > -9000, neighbor, val)
-
-    left = safe_where(left)
-    right = safe_where(right)
-    back = safe_where(back)
-    front = safe_where(front)
-    down = safe_where(down)
-    up = safe_where(up)
-
-    # 计算符号一致性（转换为float32确保精度）
-    sign = torch.sign(val.to(torch.float32))
-    neighbors_sign = torch.stack([
-        torch.sign(left.to(torch.float32)),
-        torch.sign(right.to(torch.float32)),
-        torch.sign(back.to(torch.float32)),
-        torch.sign(front.to(torch.float32)),
-        torch.sign(down.to(torch.float32)),
-        torch.sign(up.to(torch.float32))
-    ], dim=0)
-
-    # 检查所有符号是否一致
-    same_sign = torch.all(neighbors_sign == sign, dim=0)
-
-    # 生成最终掩码
-    mask = (~same_sign).to(torch.int32)
-    return mask * valid_mask.to(torch.int32)
+                head[axis] = slice(None, -1)
+                tail[axis] = slice(1, None)
+            head, tail = tuple(head), tuple(tail)
+            change = sign[head] != sign[tail]
+            change &= valid[head]
+            change &= valid[tail]
+            mask[head] |= change
+            mask[tail] |= change
+    return mask
+
+
+def generate_grid_axes(
+    bbox_min: np.ndarray,
+    bbox_max: np.ndarray,
+    octree_resolution: int,
+):
+    return [
+        np.linspace(bbox_min[i], bbox_max[i], int(octree_resolution) + 1, dtype=np.float32)
+        for i in range(3)
+    ]
 
 
 def generate_dense_grid_points(
@@ -128,9 +94,7 @@ def generate_dense_grid_points(
     length = bbox_max - bbox_min
     num_cells = octree_resolution
 
-    x = np.linspace(bbox_min[0], bbox_max[0], int(num_cells) + 1, dtype=np.float32)
-    y = np.linspace(bbox_min[1], bbox_max[1], int(num_cells) + 1, dtype=np.float32)
-    z = np.linspace(bbox_min[2], bbox_max[2], int(num_cells) + 1, dtype=np.float32)
+    x, y, z = generate_grid_axes(bbox_min, bbox_max, num_cells)
     [xs, ys, zs] = np.meshgrid(x, y, z, indexing=indexing)
     xyz = np.stack((xs, ys, zs), axis=-1)
     grid_size = [int(num_cells) + 1, int(num_cells) + 1, int(num_cells) + 1]
@@ -138,47 +102,169 @@ def generate_dense_grid_points(
     return xyz, grid_size, length
 
 
+def grid_query_tables(geo_decoder: CrossAttentionDecoder, bbox_min, bbox_max, octree_resolution, device, dtype):
+    axes = generate_grid_axes(bbox_min, bbox_max, octree_resolution)
+    axes = [torch.from_numpy(axis).to(device, dtype=dtype) for axis in axes]
+    return geo_decoder.grid_query_tables(axes)
+
+
+def unravel_grid_index(flat_index: torch.LongTensor, grid_size) -> torch.LongTensor:
+    """Integer (i, j, k) coordinates of flat indices into a C-ordered grid of shape `grid_size`."""
+    ny, nz = int(grid_size[1]), int(grid_size[2])
+    return torch.stack((flat_index // (ny * nz), flat_index // nz % ny, flat_index % nz), dim=-1)
+
+
+def iter_grid_chunks(grid_size, num_chunks: int, device=None):
+    """
+    Integer coordinates of a C-ordered grid of shape `grid_size`, generated `num_chunks` points at a time from flat
+    index ranges, so the grid itself is never materialized.
+
+    Yields:
+        (start, index): the flat index of the first point of the chunk and its coordinates, shape [n, 3].
+    """
+    num_points = int(np.prod(grid_size))
+    for start in range(0, num_points, num_chunks):
+        flat_index = torch.arange(start, min(start + num_chunks, num_points), device=device)
+        yield start, unravel_grid_index(flat_index, grid_size)
+
+
+def mini_grid_index(mini_grid: torch.LongTensor, mini_grid_num: int, mini_grid_size: int) -> torch.LongTensor:
+    """
+    Integer coordinates of the points of mini grids, the `mini_grid_num`^3 cubes of `mini_grid_size`^3 points
+    that FlashVDM decodes as separate batch rows. Mini grids and their points are numbered in C order.
+
+    Returns:
+        index: shape [len(mini_grid), mini_grid_size ** 3, 3].
+    """
+    local = torch.arange(mini_grid_size ** 3, device=mini_grid.device)
+    local = unravel_grid_index(local, [mini_grid_size] * 3)
+    origin = unravel_grid_index(mini_grid, [mini_grid_num] * 3) * mini_grid_size
+    return origin[:, None] + local[None]
+
+
+def octree_resolutions(octree_resolution: int, min_resolution: int) -> List[int]:
+    """Resolutions of the hierarchical decoding levels, coarse to fine, halving down to `min_resolution`."""
+    resolutions = []
+    if octree_resolution < min_resolution:
+        resolutions.append(octree_resolution)
+    while octree_resolution >= min_resolution:
+        resolutions.append(octree_resolution)
+        octree_resolution = octree_resolution // 2
+    resolutions.reverse()
+    return resolutions
+
+
+def next_level_keys(grid: Union[torch.Tensor, SparseVolume], mc_level: float, next_resolution: int, expand_num: int):
+    """
+    Keys (see `encode_keys`) of the points to evaluate at `next_resolution`: the narrow band around the surface of
+    the coarser `grid`, dilated by `expand_num` coarse cells and `2 - expand_num` fine cells.
+    """
+    if isinstance(grid, SparseVolume):
+        keys = extract_near_surface_keys(grid, mc_level)
+    else:
+        curr_points = extract_near_surface_volume_fn(grid, mc_level)
+        curr_points |= grid.abs() < 0.95
+        keys = torch.nonzero(curr_points.reshape(-1)).squeeze(-1)
+    grid_size, next_grid_size = grid.shape[0], next_resolution + 1
+    keys = dilate_keys(keys, expand_num, grid_size)
+    next_keys = encode_keys(decode_keys(keys, grid_size) * 2, next_grid_size)
+    return dilate_keys(next_keys, 2 - expand_num, next_grid_size)
+
+
+def decode_grid_keys(
+    geo_decoder: CrossAttentionDecoder,
+    latents: torch.FloatTensor,
+    tables: List[torch.Tensor],
+    keys: List[torch.LongTensor],
+    grid_size: int,
+    num_chunks: int = 10000,
+    desc: str = None,
+    enable_pbar: bool = True,
+) -> List[torch.Tensor]:
+    """
+    Decode the grid points `keys[i]` (see `encode_keys`) of every sample i of `latents`.
+
+    Queries of all samples are packed into shared chunks of about `num_chunks` points, one batch row per sample
+    that still has points left, so samples with small active sets do not cost extra decoder calls. Rows are
+    padded to the longest one in the chunk.
+
+    Returns:
+        logits of the points, one [len(keys[i])] tensor per sample.
+    """
+    batch_size = len(keys)
+    lengths = [key.shape[0] for key in keys]
+    offsets = [0] * batch_size
+    values = [[] for _ in range(batch_size)]
+    with tqdm(total=sum(lengths), desc=desc, disable=not enable_pbar) as pbar:
+        while True:
+            rows = [i for i in range(batch_size) if offsets[i] < lengths[i]]
+            if not rows:
+                break
+            step = max(num_chunks // len(rows), 1)
+            index = [decode_keys(keys[i][offsets[i]:offsets[i] + step], grid_size) for i in rows]
+            query_embeddings = geo_decoder.grid_query_embeddings(tables, pad_sequence(index, batch_first=True))
+            latent_index = None
+            if len(rows) != latents.shape[0]:
+                latent_index = torch.tensor(rows, device=latents.device)
+            logits = geo_decoder(query_embeddings=query_embeddings, latents=latents, latent_index=latent_index)
+            for row, i in enumerate(rows):
+                values[i].append(logits[row, :index[row].shape[0], 0])
+                offsets[i] += step
+            pbar.update(sum(chunk.shape[0] for chunk in index))
+    return [torch.cat(value) if value else latents.new_empty(0) for value in values]
+
+
+def finish_levels(levels: List[Tuple[int, list]], return_levels: bool):
+    """
+    Output of the hierarchical decoders: one `SparseVolume` per sample for the finest level, or with
+    `return_levels` every (resolution, volumes) level from coarse to fine.
+    """
+    levels = [(resolution, [volume if isinstance(volume, SparseVolume) else SparseVolume.from_dense(volume)
+                            for volume in volumes]) for resolution, volumes in levels]
+    if return_levels:
+        return levels
+    return levels[-1][1]
+
+
 class VanillaVolumeDecoder:
     @torch.no_grad()
     def __call__(
         self,
         latents: torch.FloatTensor,
-        geo_decoder: Callable,
+        geo_decoder: CrossAttentionDecoder,
         bounds: Union[Tuple[float], List[float], float] = 1.01,
         num_chunks: int = 10000,
         octree_resolution: int = None,
         enable_pbar: bool = True,
+        return_levels: bool = False,
         **kwargs,
     ):
         device = latents.device
         dtype = latents.dtype
         batch_size = latents.shape[0]
 
-        # 1. generate query points
+        # 1. generate query embedding tables, the grid itself is never materialized
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
 
         bbox_min, bbox_max = np.array(bounds[0:3]), np.array(bounds[3:6])
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=octree_resolution,
-            indexing="ij"
-        )
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
-
-        # 2. latents to 3d volume
-        batch_logits = []
-        for start in tqdm(range(0, xyz_samples.shape[0], num_chunks), desc=f"Volume Decoding",
-                          disable=not enable_pbar):
-            chunk_queries = xyz_samples[start: start + num_chunks, :]
-            chunk_queries = repeat(chunk_queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=chunk_queries, latents=latents)
-            batch_logits.append(logits)
-
-        grid_logits = torch.cat(batch_logits, dim=1)
-        grid_logits = grid_logits.view((batch_size, *grid_size)).float()
-
+        grid_size = [int(octree_resolution) + 1] * 3
+        tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, octree_resolution, device, dtype)
+        num_points = int(np.prod(grid_size))
+
+        # 2. latents to 3d volume, written chunk by chunk into the output
+        grid_logits = torch.empty((batch_size, num_points), dtype=torch.float32, device=device)
+        for start, index in tqdm(iter_grid_chunks(grid_size, num_chunks, device), desc=f"Volume Decoding",
+                                 total=-(-num_points // num_chunks), disable=not enable_pbar):
+            chunk_embeddings = geo_decoder.grid_query_embeddings(tables, index)
+            chunk_embeddings = repeat(chunk_embeddings, "p c -> b p c", b=batch_size)
+            logits = geo_decoder(query_embeddings=chunk_embeddings, latents=latents)
+            grid_logits[:, start:start + index.shape[0]] = logits[..., 0]
+
+        grid_logits = grid_logits.view((batch_size, *grid_size))
+
+        if return_levels:
+            return [(int(octree_resolution), grid_logits)]
         return grid_logits
 
 
@@ -194,87 +280,55 @@ class HierarchicalVolumeDecoding:
         octree_resolution: int = None,
         min_resolution: int = 63,
         enable_pbar: bool = True,
+        return_levels: bool = False,
         **kwargs,
     ):
         device = latents.device
         dtype = latents.dtype
 
-        resolutions = []
-        if octree_resolution < min_resolution:
-            resolutions.append(octree_resolution)
-        while octree_resolution >= min_resolution:
-            resolutions.append(octree_resolution)
-            octree_resolution = octree_resolution // 2
-        resolutions.reverse()
+        resolutions = octree_resolutions(octree_resolution, min_resolution)
 
         # 1. generate query points
         if isinstance(bounds, float):
             bounds = [-bounds, -bounds, -bounds, bounds, bounds, bounds]
         bbox_min = np.array(bounds[0:3])
         bbox_max = np.array(bounds[3:6])
-        bbox_size = bbox_max - bbox_min
 
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
-
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype).contiguous().reshape(-1, 3)
+        grid_size = np.array([resolutions[0] + 1] * 3)
+        tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, resolutions[0], device, dtype)
+        num_points = int(np.prod(grid_size))
 
         # 2. latents to 3d volume
-        batch_logits = []
         batch_size = latents.shape[0]
-        for start in tqdm(range(0, xyz_samples.shape[0], num_chunks),
-                          desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]"):
-            queries = xyz_samples[start: start + num_chunks, :]
-            batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-            logits = geo_decoder(queries=batch_queries, latents=latents)
-            batch_logits.append(logits)
-
-        grid_logits = torch.cat(batch_logits, dim=1).view((batch_size, grid_size[0], grid_size[1], grid_size[2]))
-
+        grid_logits = torch.empty((batch_size, num_points), dtype=dtype, device=device)
+        for start, index in tqdm(iter_grid_chunks(grid_size, num_chunks, device),
+                                 desc=f"Hierarchical Volume Decoding [r{resolutions[0] + 1}]",
+                                 total=-(-num_points // num_chunks)):
+            query_embeddings = geo_decoder.grid_query_embeddings(tables, index)
+            batch_embeddings = repeat(query_embeddings, "p c -> b p c", b=batch_size)
+            logits = geo_decoder(query_embeddings=batch_embeddings, latents=latents)
+            grid_logits[:, start:start + index.shape[0]] = logits[..., 0]
+
+        grid_logits = grid_logits.view((batch_size, grid_size[0], grid_size[1], grid_size[2]))
+
+        # 3. refine the narrow band around each surface, only the evaluated points are stored
+        volumes = list(grid_logits)
+        levels = [(resolutions[0], volumes)]
         for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
-            resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
             if octree_depth_now == resolutions[-1]:
                 expand_num = 0
             else:
                 expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
-            next_points = (next_points * torch.tensor(resolution, dtype=next_points.dtype, device=device) +
-                           torch.tensor(bbox_min, dtype=next_points.dtype, device=device))
-            batch_logits = []
-            for start in tqdm(range(0, next_points.shape[0], num_chunks),
-                              desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]"):
-                queries = next_points[start: start + num_chunks, :]
-                batch_queries = repeat(queries, "p c -> b p c", b=batch_size)
-                logits = geo_decoder(queries=batch_queries.to(latents.dtype), latents=latents)
-                batch_logits.append(logits)
-            grid_logits = torch.cat(batch_logits, dim=1)
-            next_logits[nidx] = grid_logits[0, ..., 0]
-            grid_logits = next_logits.unsqueeze(0)
-        grid_logits[grid_logits == -10000.] = float('nan')
+            next_keys = [next_level_keys(volume, mc_level, octree_depth_now, expand_num) for volume in volumes]
 
-        return grid_logits
+            tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, octree_depth_now, device, dtype)
+            values = decode_grid_keys(geo_decoder, latents, tables, next_keys, octree_depth_now + 1, num_chunks,
+                                      desc=f"Hierarchical Volume Decoding [r{octree_depth_now + 1}]",
+                                      enable_pbar=enable_pbar)
+            volumes = [SparseVolume(keys, value, octree_depth_now) for keys, value in zip(next_keys, values)]
+            levels.append((octree_depth_now, volumes))
+
+        return finish_levels(levels, return_levels)
 
 
 class FlashVDMVolumeDecoding:
@@ -299,6 +353,7 @@ class FlashVDMVolumeDecoding:
         min_resolution: int = 63,
         mini_grid_num: int = 4,
         enable_pbar: bool = True,
+        return_levels: bool = False,
         **kwargs,
     ):
         processor = self.processor
@@ -307,13 +362,7 @@ class FlashVDMVolumeDecoding:
         device = latents.device
         dtype = latents.dtype
 
-        resolutions = []
-        if octree_resolution < min_resolution:
-            resolutions.append(octree_resolution)
-        while octree_resolution >= min_resolution:
-            resolutions.append(octree_resolution)
-            octree_resolution = octree_resolution // 2
-        resolutions.reverse()
+        resolutions = octree_resolutions(octree_resolution, min_resolution)
         resolutions[0] = round(resolutions[0] / mini_grid_num) * mini_grid_num - 1
         for i, resolution in enumerate(resolutions[1:]):
             resolutions[i + 1] = resolutions[0] * 2 ** (i + 1)
@@ -327,109 +376,112 @@ class FlashVDMVolumeDecoding:
         bbox_max = np.array(bounds[3:6])
         bbox_size = bbox_max - bbox_min
 
-        xyz_samples, grid_size, length = generate_dense_grid_points(
-            bbox_min=bbox_min,
-            bbox_max=bbox_max,
-            octree_resolution=resolutions[0],
-            indexing="ij"
-        )
-
-        dilate = nn.Conv3d(1, 1, 3, padding=1, bias=False, device=device, dtype=dtype)
-        dilate.weight = torch.nn.Parameter(torch.ones(dilate.weight.shape, dtype=dtype, device=device))
-
-        grid_size = np.array(grid_size)
+        grid_size = np.array([resolutions[0] + 1] * 3)
+        tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, resolutions[0], device, dtype)
 
-        # 2. latents to 3d volume
-        xyz_samples = torch.from_numpy(xyz_samples).to(device, dtype=dtype)
+        # 2. latents to 3d volume, every mini grid of every sample is one batch row and rows of different
+        # samples share chunks. The coordinates of a chunk are generated from its row numbers.
         batch_size = latents.shape[0]
-        mini_grid_size = xyz_samples.shape[0] // mini_grid_num
-        xyz_samples = xyz_samples.view(
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size,
-            mini_grid_num, mini_grid_size, 3
-        ).permute(
-            0, 2, 4, 1, 3, 5, 6
-        ).reshape(
-            -1, mini_grid_size * mini_grid_size * mini_grid_size, 3
-        )
-        batch_logits = []
-        num_batchs = max(num_chunks // xyz_samples.shape[1], 1)
-        for start in tqdm(range(0, xyz_samples.shape[0], num_batchs),
+        mini_grid_size = int(grid_size[0]) // mini_grid_num
+        num_mini_grids = mini_grid_num ** 3
+        num_rows = batch_size * num_mini_grids
+        grid_logits = torch.empty((num_rows, mini_grid_size ** 3), dtype=dtype, device=device)
+        num_batchs = max(num_chunks // mini_grid_size ** 3, 1)
+        for start in tqdm(range(0, num_rows, num_batchs),
                           desc=f"FlashVDM Volume Decoding", disable=not enable_pbar):
-            queries = xyz_samples[start: start + num_batchs, :]
-            batch = queries.shape[0]
-            batch_latents = repeat(latents.squeeze(0), "p c -> b p c", b=batch)
+            rows = torch.arange(start, min(start + num_batchs, num_rows), device=device)
+            index = mini_grid_index(rows % num_mini_grids, mini_grid_num, mini_grid_size)
+            query_embeddings = geo_decoder.grid_query_embeddings(tables, index)
             processor.topk = True
-            logits = geo_decoder(queries=queries, latents=batch_latents)
-            batch_logits.append(logits)
-        grid_logits = torch.cat(batch_logits, dim=0).reshape(
+            latent_index = rows // num_mini_grids if batch_size > 1 else None
+            logits = geo_decoder(query_embeddings=query_embeddings, latents=latents, latent_index=latent_index)
+            grid_logits[start:start + rows.shape[0]] = logits[..., 0]
+        grid_logits = grid_logits.reshape(
+            batch_size,
             mini_grid_num, mini_grid_num, mini_grid_num,
             mini_grid_size, mini_grid_size,
             mini_grid_size
-        ).permute(0, 3, 1, 4, 2, 5).contiguous().view(
+        ).permute(0, 1, 4, 2, 5, 3, 6).contiguous().view(
             (batch_size, grid_size[0], grid_size[1], grid_size[2])
         )
 
+        # 3. refine the narrow band around each surface, only the evaluated points are stored
+        volumes = list(grid_logits)
+        levels = [(resolutions[0], volumes)]
         for octree_depth_now in resolutions[1:]:
-            grid_size = np.array([octree_depth_now + 1] * 3)
-            resolution = bbox_size / octree_depth_now
-            next_index = torch.zeros(tuple(grid_size), dtype=dtype, device=device)
-            next_logits = torch.full(next_index.shape, -10000., dtype=dtype, device=device)
-            curr_points = extract_near_surface_volume_fn(grid_logits.squeeze(0), mc_level)
-            curr_points += grid_logits.squeeze(0).abs() < 0.95
-
             if octree_depth_now == resolutions[-1]:
                 expand_num = 0
             else:
                 expand_num = 1
-            for i in range(expand_num):
-                curr_points = dilate(curr_points.unsqueeze(0).to(dtype)).squeeze(0)
-            (cidx_x, cidx_y, cidx_z) = torch.where(curr_points > 0)
-
-            next_index[cidx_x * 2, cidx_y * 2, cidx_z * 2] = 1
-            for i in range(2 - expand_num):
-                next_index = dilate(next_index.unsqueeze(0)).squeeze(0)
-            nidx = torch.where(next_index > 0)
-
-            next_points = torch.stack(nidx, dim=1)
-            next_points = (next_points * torch.tensor(resolution, dtype=torch.float32, device=device) +
-                           torch.tensor(bbox_min, dtype=torch.float32, device=device))
-
-            query_grid_num = 6
+            tables = grid_query_tables(geo_decoder, bbox_min, bbox_max, octree_depth_now, device, dtype)
+            keys = [next_level_keys(volume, mc_level, octree_depth_now, expand_num) for volume in volumes]
+            values = self._decode_keys(geo_decoder, latents, tables, keys, octree_depth_now, bbox_min, bbox_size,
+                                       num_chunks)
+            volumes = [SparseVolume(key, value, octree_depth_now) for key, value in zip(keys, values)]
+            levels.append((octree_depth_now, volumes))
+
+        return finish_levels(levels, return_levels)
+
+    def _decode_keys(self, geo_decoder, latents, tables, keys, octree_depth_now, bbox_min, bbox_size, num_chunks):
+        """
+        Decode the narrow band points `keys[i]` of every sample i. The points of a sample are bucketed into the
+        cells of the adaptive kv selection, and whole cells of all samples are packed into shared calls of about
+        `num_chunks` points, one batch row per sample that still has cells left, as in `decode_grid_keys`.
+
+        Returns:
+            logits of the points, one [len(keys[i])] tensor per sample.
+        """
+        processor = self.processor
+        device = latents.device
+        resolution = torch.tensor(bbox_size / octree_depth_now, dtype=torch.float32, device=device)
+        offset = torch.tensor(bbox_min, dtype=torch.float32, device=device)
+        query_grid_num = 6
+        points, orders, cells = [], [], []
+        for next_keys in keys:
+            next_index_points = decode_keys(next_keys, octree_depth_now + 1)
+            if next_index_points.shape[0] == 0:
+                points.append(next_index_points)
+                orders.append(None)
+                cells.append(next_keys.new_empty(0))
+                continue
+            next_points = next_index_points * resolution + offset
             min_val = next_points.min(axis=0).values
             max_val = next_points.max(axis=0).values
             vol_queries_index = (next_points - min_val) / (max_val - min_val) * (query_grid_num - 0.001)
             index = torch.floor(vol_queries_index).long()
             index = index[..., 0] * (query_grid_num ** 2) + index[..., 1] * query_grid_num + index[..., 2]
             index = index.sort()
-            next_points = next_points[index.indices].unsqueeze(0).contiguous()
-            unique_values = torch.unique(index.values, return_counts=True)
-            grid_logits = torch.zeros((next_points.shape[1]), dtype=latents.dtype, device=latents.device)
-            input_grid = [[], []]
-            logits_grid_list = []
-            start_num = 0
-            sum_num = 0
-            for grid_index, count in zip(unique_values[0].cpu().tolist(), unique_values[1].cpu().tolist()):
-                if sum_num + count < num_chunks or sum_num == 0:
-                    sum_num += count
-                    input_grid[0].append(grid_index)
-                    input_grid[1].append(count)
-                else:
-                    processor.topk = input_grid
-                    logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
-                    start_num = start_num + sum_num
-                    logits_grid_list.append(logits_grid)
-                    input_grid = [[grid_index], [count]]
-                    sum_num = count
-            if sum_num > 0:
-                processor.topk = input_grid
-                logits_grid = geo_decoder(queries=next_points[:, start_num:start_num + sum_num], latents=latents)
-                logits_grid_list.append(logits_grid)
-            logits_grid = torch.cat(logits_grid_list, dim=1)
-            grid_logits[index.indices] = logits_grid.squeeze(0).squeeze(-1)
-            next_logits[nidx] = grid_logits
-            grid_logits = next_logits.unsqueeze(0)
-
-        grid_logits[grid_logits == -10000.] = float('nan')
-
+            points.append(next_index_points[index.indices])
+            orders.append(index.indices)
+            cells.append(torch.unique_consecutive(index.values, return_counts=True)[1])
+
+        batch_size = len(keys)
+        counts = [cell.tolist() for cell in cells]
+        starts = [list(accumulate(count, initial=0)) for count in counts]
+        cursors = [0] * batch_size
+        values = [[] for _ in range(batch_size)]
+        while True:
+            rows = [i for i in range(batch_size) if cursors[i] < len(counts[i])]
+            if not rows:
+                break
+            # whole cells go to one call, a row takes the cells that start within `step` points of its first one
+            step = max(num_chunks // len(rows), 1)
+            ends = [bisect_left(starts[i], starts[i][cursors[i]] + step, cursors[i] + 1, len(counts[i])) for i in rows]
+            index = [points[i][starts[i][cursors[i]]:starts[i][end]] for i, end in zip(rows, ends)]
+            processor.topk = pad_sequence([cells[i][cursors[i]:end] for i, end in zip(rows, ends)], batch_first=True)
+            query_embeddings = geo_decoder.grid_query_embeddings(tables, pad_sequence(index, batch_first=True))
+            latent_index = None
+            if len(rows) != latents.shape[0]:
+                latent_index = torch.tensor(rows, device=device)
+            logits = geo_decoder(query_embeddings=query_embeddings, latents=latents, latent_index=latent_index)
+            for row, (i, end) in enumerate(zip(rows, ends)):
+                values[i].append(logits[row, :index[row].shape[0], 0])
+                cursors[i] = end
+
+        grid_logits = []
+        for i in range(batch_size):
+            value = latents.new_zeros(points[i].shape[0])
+            if values[i]:
+                value[orders[i]] = torch.cat(values[i])
+            grid_logits.append(value)
         return grid_logits
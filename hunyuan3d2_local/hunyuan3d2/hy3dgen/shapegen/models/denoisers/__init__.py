@@ -13,3 +13,6 @@
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
 from .hunyuan3ddit import Hunyuan3DDiT
+from .condition import PreparedCondition, narrow_batch
+from .feature_cache import FeatureCache
+from .moe_layers import RoutingStats, enable_routing_stats, routing_stats_report, prune_moe_experts
@@ -0,0 +1,52 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+from dataclasses import dataclass, fields, replace
+from typing import List, Optional
+
+from torch import Tensor
+
+
+@dataclass
+class PreparedCondition:
+    """
+    Timestep-invariant denoiser inputs, built once per sampling call by `model.prepare_condition(contexts)`
+    and passed in place of `contexts` at every step.
+
+    Args:
+        contexts: the raw condition dict produced by the conditioner.
+        cond: condition tokens after the model's input projection.
+        cond_kv: per-block cross-attention keys/values, for denoisers that attend to fixed condition tokens.
+        vec: condition-only term added to the timestep embedding.
+        guidance: projected guidance term added to the timestep embedding, for guidance-distilled models.
+    """
+
+    contexts: dict
+    cond: Optional[Tensor] = None
+    cond_kv: Optional[List] = None
+    vec: Optional[Tensor] = None
+    guidance: Optional[Tensor] = None
+
+
+def narrow_batch(value, start: int, length: int):
+    """Slice the batch dimension of every tensor in a (nested) condition, leaving everything else as is."""
+    if isinstance(value, Tensor):
+        return value.narrow(0, start, length)
+    if isinstance(value, PreparedCondition):
+        return replace(value, **{f.name: narrow_batch(getattr(value, f.name), start, length) for f in fields(value)})
+    if isinstance(value, dict):
+        return {k: narrow_batch(v, start, length) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(narrow_batch(v, start, length) for v in value)
+    return value
@@ -0,0 +1,92 @@
+# Hunyuan 3D is licensed under the TENCENT HUNYUAN NON-COMMERCIAL LICENSE AGREEMENT
+# except for the third-party components listed below.
+# Hunyuan 3D does not impose any additional limitations beyond what is outlined
+# in the repsective licenses of these third-party components.
+# Users must comply with all terms and conditions of original licenses of these third-party
+# components and must ensure that the usage of the third party components adheres to
+# all relevant laws and regulations.
+
+# For avoidance of doubts, Hunyuan 3D means the large language models and
+# their software and algorithms, including trained model weights, parameters (including
+# optimizer states), machine-learning model code, inference-enabling code, training-enabling code,
+# fine-tuning enabling code and other elements of the foregoing made publicly available
+# by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
+
+from typing import Optional
+
+from torch import Tensor
+
+
+class FeatureCache:
+    """
+    Step-to-step reuse of the deep blocks of a denoiser.
+
+    Denoisers that support it (`feature_cache` attribute) run their first `num_shallow_blocks` blocks at every
+    step and ask the cache, with the output of those blocks, whether the residual the remaining blocks added at
+    the last refresh can be reused instead of running them. The residual is refreshed:
+        - every `refresh_interval` steps, and/or
+        - once the relative L1 change of the shallow output, accumulated over the steps since the last refresh,
+          exceeds `threshold`. This bounds how far the inputs of the skipped blocks drifted from the ones the
+          residual was computed for.
+    Steps with a different batch shape (e.g. after classifier-free guidance is dropped) always refresh. Call
+    `reset` before every sampling run; `hit_rate` reports the fraction of steps that reused the residual.
+    """
+
+    def __init__(
+        self,
+        num_shallow_blocks: int = 1,
+        refresh_interval: Optional[int] = None,
+        threshold: Optional[float] = None,
+    ):
+        if refresh_interval is None and threshold is None:
+            raise ValueError("FeatureCache needs a refresh_interval, a threshold or both")
+        if num_shallow_blocks < 1:
+            raise ValueError(f"num_shallow_blocks must be at least 1, got {num_shallow_blocks}")
+        self.num_shallow_blocks = num_shallow_blocks
+        self.refresh_interval = refresh_interval
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        self.shallow = None
+        self.residual = None
+        self.accumulated_change = 0.0
+        self.steps_since_refresh = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        steps = self.hits + self.misses
+        return self.hits / steps if steps else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {'cache_hits': self.hits, 'cache_misses': self.misses, 'cache_hit_rate': self.hit_rate}
+
+    def lookup(self, shallow: Tensor) -> Optional[Tensor]:
+        """
+        The residual to add to `shallow` in place of the deep blocks, or None if it must be refreshed: the caller
+        then runs the deep blocks and passes their residual to `store`.
+        """
+        reuse = self.residual is not None and self.shallow.shape == shallow.shape
+        if reuse and self.refresh_interval is not None:
+            reuse = self.steps_since_refresh + 1 < self.refresh_interval
+        if reuse and self.threshold is not None:
+            previous = self.shallow.float()
+            change = (shallow.float() - previous).abs().mean() / previous.abs().mean().clamp(min=1e-12)
+            self.accumulated_change += change.item()
+            reuse = self.accumulated_change <= self.threshold
+        self.shallow = shallow
+
+        if reuse:
+            self.hits += 1
+            self.steps_since_refresh += 1
+            return self.residual
+        self.misses += 1
+        return None
+
+    def store(self, residual: Tensor):
+        self.residual = residual
+        self.accumulated_change = 0.0
+        self.steps_since_refresh = 0
@@ -21,6 +21,9 @@ import torch
 from einops import rearrange
 from torch import Tensor, nn
 
+from .condition import PreparedCondition
+from .feature_cache import FeatureCache
+
 scaled_dot_product_attention = nn.functional.scaled_dot_product_attention
 if os.environ.get('USE_SAGEATTN', '0') == '1':
     try:
@@ -282,6 +285,9 @@ class LastLayer(nn.Module):
 
 
 class Hunyuan3DDiT(nn.Module):
+    # optional step-to-step reuse of the blocks after the first double stream ones, see `FeatureCache`
+    feature_cache: Optional[FeatureCache] = None
+
     def __init__(
         self,
         in_channels: int = 64,
@@ -378,6 +384,23 @@ class Hunyuan3DDiT(nn.Module):
             print('unexpected keys:', unexpected)
             print('missing keys:', missing)
 
+    def prepare_condition(self, contexts, **kwargs) -> PreparedCondition:
+        """
+        Run the condition input projection and the guidance embedding, neither depends on the timestep.
+        """
+        guidance = None
+        if self.guidance_embed:
+            guidance = kwargs.get('guidance', None)
+            if guidance is None:
+                raise ValueError("Didn't get guidance strength for guidance distilled model.")
+            guidance = self.guidance_in(timestep_embedding(guidance, 256, self.time_factor))
+
+        return PreparedCondition(
+            contexts=contexts,
+            cond=self.cond_in(contexts['main']),
+            guidance=guidance,
+        )
+
     def forward(
         self,
         x,
@@ -385,26 +408,46 @@ class Hunyuan3DDiT(nn.Module):
         contexts,
         **kwargs,
     ) -> Tensor:
-        cond = contexts['main']
+        if isinstance(contexts, PreparedCondition):
+            prepared = contexts
+        else:
+            prepared = self.prepare_condition(contexts, **kwargs)
         latent = self.latent_in(x)
 
         vec = self.time_in(timestep_embedding(t, 256, self.time_factor).to(dtype=latent.dtype))
-        if self.guidance_embed:
-            guidance = kwargs.get('guidance', None)
-            if guidance is None:
-                raise ValueError("Didn't get guidance strength for guidance distilled model.")
-            vec = vec + self.guidance_in(timestep_embedding(guidance, 256, self.time_factor))
+        if prepared.guidance is not None:
+            vec = vec + prepared.guidance
 
-        cond = self.cond_in(cond)
+        cond = prepared.cond
         pe = None
 
-        for block in self.double_blocks:
+        cache = self.feature_cache
+        if cache is None:
+            latent = self.run_blocks(latent, cond, vec, pe, 0)
+        else:
+            num_shallow = cache.num_shallow_blocks
+            if num_shallow > self.depth:
+                raise ValueError(f"num_shallow_blocks must be at most {self.depth}, got {num_shallow}")
+            for block in self.double_blocks[:num_shallow]:
+                latent, cond = block(img=latent, txt=cond, vec=vec, pe=pe)
+            residual = cache.lookup(latent)
+            if residual is None:
+                shallow = latent
+                latent = self.run_blocks(latent, cond, vec, pe, num_shallow)
+                cache.store(latent - shallow)
+            else:
+                latent = latent + residual
+
+        latent = self.final_layer(latent, vec)
+        return latent
+
+    def run_blocks(self, latent: Tensor, cond: Tensor, vec: Tensor, pe: Optional[Tensor], start: int) -> Tensor:
+        """Double stream blocks from `start` on and all single stream blocks, returns the latent tokens."""
+        for block in self.double_blocks[start:]:
             latent, cond = block(img=latent, txt=cond, vec=vec, pe=pe)
 
         latent = torch.cat((cond, latent), 1)
         for block in self.single_blocks:
             latent = block(latent, vec=vec, pe=pe)
 
-        latent = latent[:, cond.shape[1]:, ...]
-        latent = self.final_layer(latent, vec)
-        return latent
+        return latent[:, cond.shape[1]:, ...]
@@ -13,6 +13,7 @@
 # by Tencent in accordance with TENCENT HUNYUAN COMMUNITY LICENSE AGREEMENT.
 
 import math
+from typing import Optional
 
 import numpy as np
 import torch
@@ -20,6 +21,8 @@ import torch.nn as nn
 import torch.nn.functional as F
 from einops import rearrange
 
+from .condition import PreparedCondition
+from .feature_cache import FeatureCache
 from .moe_layers import MoEBlock
 
 
@@ -97,13 +100,16 @@ class TimestepEmbedder(nn.Module):
 
         self.time_embed = Timesteps(hidden_size)
 
-    def forward(self, t, condition):
+    def forward(self, t, condition, condition_emb=None):
+        """`condition_emb` is `cond_proj(condition)` precomputed by the caller, it takes precedence over `condition`."""
 
         t_freq = self.time_embed(t).type(self.mlp[0].weight.dtype)
 
         # t_freq = timestep_embedding(t, self.frequency_embedding_size).type(self.mlp[0].weight.dtype)
-        if condition is not None:
-            t_freq = t_freq + self.cond_proj(condition)
+        if condition_emb is None and condition is not None:
+            condition_emb = self.cond_proj(condition)
+        if condition_emb is not None:
+            t_freq = t_freq + condition_emb
 
         t = self.mlp(t_freq)
         t = t.unsqueeze(dim=1)
@@ -161,29 +167,37 @@ class CrossAttention(nn.Module):
             self.dca_dim = decoupled_ca_dim
             self.dca_weight = decoupled_ca_weight
 
-    def forward(self, x, y):
+    def project_kv(self, y):
         """
+        Project the condition tokens into per-head keys and values.
+
+        The result only depends on `y`, so it can be computed once per request and passed to `forward`
+        through `kv` at every diffusion step.
+
         Parameters
         ----------
-        x: torch.Tensor
-            (batch, seqlen1, hidden_dim) (where hidden_dim = num heads * head dim)
         y: torch.Tensor
             (batch, seqlen2, hidden_dim2)
-        freqs_cis_img: torch.Tensor
-            (batch, hidden_dim // 2), RoPE for image
-        """
-        b, s1, c = x.shape  # [b, s1, D]
 
+        Returns
+        -------
+        kv: tuple
+            (k, v, k_dca, v_dca), each (batch, num_heads, seqlen, head_dim). The decoupled entries are None
+            when the block has no decoupled cross-attention.
+        """
+        b = y.shape[0]
+        k_dca, v_dca = None, None
         if self.with_dca:
             token_len = y.shape[1]
             context_dca = y[:, -self.dca_dim:, :]
             kv_dca = self.kv_proj_dca(context_dca).view(b, self.dca_dim, 2, self.num_heads, self.head_dim)
             k_dca, v_dca = kv_dca.unbind(dim=2)  # [b, s, h, d]
             k_dca = self.k_norm_dca(k_dca)
+            k_dca, v_dca = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.num_heads),
+                               (k_dca, v_dca))
             y = y[:, :(token_len - self.dca_dim), :]
 
         _, s2, c = y.shape  # [b, s2, 1024]
-        q = self.to_q(x)
         k = self.to_k(y)
         v = self.to_v(y)
 
@@ -192,19 +206,40 @@ class CrossAttention(nn.Module):
         kv = kv.view(1, -1, self.num_heads, split_size * 2)
         k, v = torch.split(kv, split_size, dim=-1)
 
-        q = q.view(b, s1, self.num_heads, self.head_dim)  # [b, s1, h, d]
         k = k.view(b, s2, self.num_heads, self.head_dim)  # [b, s2, h, d]
         v = v.view(b, s2, self.num_heads, self.head_dim)  # [b, s2, h, d]
 
-        q = self.q_norm(q)
         k = self.k_norm(k)
+        k, v = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.num_heads), (k, v))
+        return k, v, k_dca, v_dca
+
+    def forward(self, x, y=None, kv=None):
+        """
+        Parameters
+        ----------
+        x: torch.Tensor
+            (batch, seqlen1, hidden_dim) (where hidden_dim = num heads * head dim)
+        y: torch.Tensor
+            (batch, seqlen2, hidden_dim2), ignored when `kv` is given
+        kv: tuple, optional
+            precomputed output of `project_kv(y)`
+        """
+        b, s1, c = x.shape  # [b, s1, D]
+
+        if kv is None:
+            kv = self.project_kv(y)
+        k, v, k_dca, v_dca = kv
+
+        q = self.to_q(x)
+        q = q.view(b, s1, self.num_heads, self.head_dim)  # [b, s1, h, d]
+        q = self.q_norm(q)
 
         with torch.backends.cuda.sdp_kernel(
             enable_flash=True,
             enable_math=False,
             enable_mem_efficient=True
         ):
-            q, k, v = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.num_heads), (q, k, v))
+            q = rearrange(q, 'b n h d -> b h n d', h=self.num_heads)
             context = F.scaled_dot_product_attention(
                 q, k, v
             ).transpose(1, 2).reshape(b, s1, -1)
@@ -215,8 +250,6 @@ class CrossAttention(nn.Module):
                 enable_math=False,
                 enable_mem_efficient=True
             ):
-                k_dca, v_dca = map(lambda t: rearrange(t, 'b n h d -> b h n d', h=self.num_heads),
-                                   (k_dca, v_dca))
                 context_dca = F.scaled_dot_product_attention(
                     q, k_dca, v_dca).transpose(1, 2).reshape(b, s1, -1)
 
@@ -362,7 +395,7 @@ class HunYuanDiTBlock(nn.Module):
         else:
             self.mlp = MLP(width=hidden_size)
 
-    def forward(self, x, c=None, text_states=None, skip_value=None):
+    def forward(self, x, c=None, text_states=None, skip_value=None, cond_kv=None):
 
         if self.skip_linear is not None:
             cat = torch.cat([skip_value, x], dim=-1)
@@ -379,7 +412,7 @@ class HunYuanDiTBlock(nn.Module):
         x = x + attn_out
 
         # Cross-Attention
-        x = x + self.attn2(self.norm2(x), text_states)
+        x = x + self.attn2(self.norm2(x), text_states, kv=cond_kv)
 
         # FFN Layer
         mlp_inputs = self.norm3(x)
@@ -453,6 +486,8 @@ class FinalLayer(nn.Module):
 
 
 class HunYuanDiTPlain(nn.Module):
+    # optional step-to-step reuse of the blocks between the outer skip-connected ones, see `FeatureCache`
+    feature_cache: Optional[FeatureCache] = None
 
     def __init__(
         self,
@@ -552,34 +587,82 @@ class HunYuanDiTPlain(nn.Module):
 
         self.final_layer = FinalLayer(hidden_size, self.out_channels)
 
-    def forward(self, x, t, contexts, **kwargs):
+    def prepare_condition(self, contexts, **kwargs):
+        """
+        Run everything that only depends on the condition: the pooled condition vector, the decoupled
+        condition projection, the per-block cross-attention K/V and the LCM guidance projection.
+        """
         cond = contexts['main']
 
-        t = self.t_embedder(t, condition=kwargs.get('guidance_cond'))
+        vec = None
+        if self.use_attention_pooling:
+            vec = self.extra_embedder(self.pooler(cond, None))
+
+        if self.with_decoupled_ca:
+            additional_cond = self.additional_cond_proj(contexts['additional'])
+            cond = torch.cat([cond, additional_cond], dim=1)
+
+        guidance = None
+        if kwargs.get('guidance_cond') is not None:
+            guidance = self.t_embedder.cond_proj(kwargs['guidance_cond'])
+
+        return PreparedCondition(
+            contexts=contexts,
+            cond=cond,
+            cond_kv=[block.attn2.project_kv(cond) for block in self.blocks],
+            vec=vec,
+            guidance=guidance,
+        )
+
+    def forward(self, x, t, contexts, **kwargs):
+        if isinstance(contexts, PreparedCondition):
+            prepared = contexts
+        else:
+            prepared = self.prepare_condition(contexts, **kwargs)
+
+        t = self.t_embedder(t, condition=kwargs.get('guidance_cond'), condition_emb=prepared.guidance)
         x = self.x_embedder(x)
 
         if self.use_pos_emb:
             pos_embed = self.pos_embed.to(x.dtype)
             x = x + pos_embed
 
-        if self.use_attention_pooling:
-            extra_vec = self.pooler(cond, None)
-            c = t + self.extra_embedder(extra_vec)  # [B, D]
+        if prepared.vec is not None:
+            c = t + prepared.vec  # [B, D]
         else:
             c = t
 
-        if self.with_decoupled_ca:
-            additional_cond = self.additional_cond_proj(contexts['additional'])
-            cond = torch.cat([cond, additional_cond], dim=1)
-
         x = torch.cat([c, x], dim=1)
 
         skip_value_list = []
-        for layer, block in enumerate(self.blocks):
+        cache = self.feature_cache
+        if cache is None:
+            x = self.run_blocks(x, c, prepared, skip_value_list, 0, self.depth)
+        else:
+            num_shallow = cache.num_shallow_blocks
+            if num_shallow > self.depth // 2:
+                raise ValueError(f"num_shallow_blocks must be at most {self.depth // 2}, got {num_shallow}")
+            # the cached span ends where only the skip values of the shallow blocks are left on the stack, so
+            # the blocks after it pop exactly what a full run would give them
+            end = 2 * (self.depth // 2) + 1 - num_shallow
+            x = self.run_blocks(x, c, prepared, skip_value_list, 0, num_shallow)
+            residual = cache.lookup(x)
+            if residual is None:
+                shallow = x
+                x = self.run_blocks(x, c, prepared, skip_value_list, num_shallow, end)
+                cache.store(x - shallow)
+            else:
+                x = x + residual
+            x = self.run_blocks(x, c, prepared, skip_value_list, end, self.depth)
+
+        x = self.final_layer(x)
+        return x
+
+    def run_blocks(self, x, c, prepared: PreparedCondition, skip_value_list: list, start: int, end: int):
+        """Blocks `start` to `end` (excluded), pushing and popping their long skip connections on `skip_value_list`."""
+        for layer in range(start, end):
             skip_value = None if layer <= self.depth // 2 else skip_value_list.pop()
-            x = block(x, c, cond, skip_value=skip_value)
+            x = self.blocks[layer](x, c, skip_value=skip_value, cond_kv=prepared.cond_kv[layer])
             if layer < self.depth // 2:
                 skip_value_list.append(x)
-
-        x = self.final_layer(x)
         return x
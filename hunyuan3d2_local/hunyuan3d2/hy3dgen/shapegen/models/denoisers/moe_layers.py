@@ -1,10 +1,17 @@
+import json
 import math
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from diffusers.models.activations import GELU
 from diffusers.models.attention import FeedForward
 
+# (device type, dtype) pairs where torch._grouped_mm failed, they use the padded batched matmul
+_GROUPED_MM_UNSUPPORTED = set()
+
 
 class AddAuxiliaryLoss(torch.autograd.Function):
     """
@@ -27,7 +34,55 @@ class AddAuxiliaryLoss(torch.autograd.Function):
         return grad_output, grad_loss
 
 
+class RoutingStats:
+    """
+    Routing counters of one `MoEGate`, accumulated on the device over every forward pass: the tokens seen, and per
+    expert the number of top-k slots routed to it and the gate weight they carried. Experts are counted by their
+    original index, also after `MoEBlock.prune_experts`, so the share of traffic that wanted a pruned expert stays
+    visible.
+    """
+
+    def __init__(self, num_experts: int):
+        self.num_experts = num_experts
+        self.reset()
+
+    def reset(self):
+        self.tokens = 0
+        self.counts = None
+        self.gate_mass = None
+
+    @torch.no_grad()
+    def update(self, topk_idx: torch.LongTensor, topk_weight: torch.Tensor):
+        topk_weight = topk_weight.detach()
+        if self.counts is None:
+            self.counts = torch.zeros(self.num_experts, dtype=torch.long, device=topk_idx.device)
+            self.gate_mass = torch.zeros(self.num_experts, dtype=torch.float64, device=topk_idx.device)
+        self.tokens += topk_idx.shape[0]
+        # out of place, the counters may be created in inference mode and updated outside of it, or the reverse
+        self.counts = self.counts + topk_idx.flatten().bincount(minlength=self.num_experts)
+        self.gate_mass = self.gate_mass.index_add(0, topk_idx.flatten(), topk_weight.flatten().to(torch.float64))
+
+    def usage(self) -> torch.Tensor:
+        """Fraction of the routed slots that went to every expert, [num_experts]."""
+        if self.counts is None:
+            return torch.zeros(self.num_experts, dtype=torch.float64)
+        return self.counts.double() / max(int(self.counts.sum()), 1)
+
+    def as_dict(self) -> dict:
+        counts = [0] * self.num_experts if self.counts is None else self.counts.tolist()
+        gate_mass = [0.0] * self.num_experts if self.gate_mass is None else self.gate_mass.tolist()
+        return {
+            'tokens': self.tokens,
+            'counts': counts,
+            'gate_mass': gate_mass,
+            'usage': self.usage().tolist(),
+        }
+
+
 class MoEGate(nn.Module):
+    # routing statistics collector, see `enable_routing_stats`
+    routing_stats: Optional[RoutingStats] = None
+
     def __init__(self, embed_dim, num_experts=16, num_experts_per_tok=2, aux_loss_alpha=0.01):
         super().__init__()
         self.top_k = num_experts_per_tok
@@ -41,6 +96,8 @@ class MoEGate(nn.Module):
         self.norm_topk_prob = False
         self.gating_dim = embed_dim
         self.weight = nn.Parameter(torch.empty((self.n_routed_experts, self.gating_dim)))
+        # original expert index -> index in `MoEBlock.experts` (-1 when dropped), set by `MoEBlock.prune_experts`
+        self.register_buffer('expert_map', None, persistent=False)
         self.reset_parameters()
 
     def reset_parameters(self) -> None:
@@ -66,6 +123,11 @@ class MoEGate(nn.Module):
             denominator = topk_weight.sum(dim=-1, keepdim=True) + 1e-20
             topk_weight = topk_weight / denominator
 
+        if self.routing_stats is not None:
+            self.routing_stats.update(topk_idx, topk_weight)
+        if self.expert_map is not None:
+            topk_idx, topk_weight = self.remap_experts(scores, topk_idx, topk_weight)
+
         ### expert-level computation auxiliary loss
         if self.training and self.alpha > 0.0:
             scores_for_aux = scores
@@ -89,6 +151,26 @@ class MoEGate(nn.Module):
             aux_loss = None
         return topk_idx, topk_weight, aux_loss
 
+    def set_expert_map(self, expert_map: torch.LongTensor):
+        self.expert_map = expert_map.to(self.weight.device)
+        self.has_dropped_experts = bool((expert_map < 0).any())
+
+    def remap_experts(self, scores, topk_idx, topk_weight):
+        """
+        Route to the experts left by `MoEBlock.prune_experts`. Tokens whose top-k hit a dropped expert take the
+        top-k of the remaining ones instead, rescaled to the gate weight of their original top-k; the others are
+        unchanged. Returns indices into `MoEBlock.experts`.
+        """
+        if self.has_dropped_experts:
+            available = self.expert_map >= 0
+            kept_weight, kept_idx = torch.topk(scores.masked_fill(~available, 0), k=self.top_k, dim=-1, sorted=False)
+            kept_weight = kept_weight * (topk_weight.sum(dim=-1, keepdim=True) /
+                                         kept_weight.sum(dim=-1, keepdim=True).clamp(min=1e-20))
+            affected = ~available[topk_idx].all(dim=-1, keepdim=True)
+            topk_idx = torch.where(affected, kept_idx, topk_idx)
+            topk_weight = torch.where(affected, kept_weight, topk_weight)
+        return self.expert_map[topk_idx], topk_weight
+
 
 class MoEBlock(nn.Module):
     def __init__(self, dim, num_experts=8, moe_top_k=2,
@@ -105,6 +187,7 @@ class MoEBlock(nn.Module):
         self.shared_experts = FeedForward(dim, dropout=dropout, activation_fn=activation_fn,
                                           final_dropout=final_dropout, inner_dim=ff_inner_dim,
                                           bias=ff_bias)
+        self._stacked_experts = None
 
     def initialize_weight(self):
         pass
@@ -129,8 +212,172 @@ class MoEBlock(nn.Module):
         y = y + self.shared_experts(identity)
         return y
 
+    @torch.no_grad()
+    def prune_experts(self, min_usage: float, mode: str = 'drop', calibration: Optional[torch.Tensor] = None) -> dict:
+        """
+        Remove the experts that received less than `min_usage` of the routed slots in the statistics collected
+        on the gate (see `enable_routing_stats`), keeping at least `moe_top_k` of them. Inference only.
+
+        Args:
+            mode: 'drop' removes them and `MoEGate.remap_experts` reroutes their tokens to the best remaining
+                experts with renormalized weights, only the tokens routed to a removed expert change. 'merge'
+                averages every removed expert into the remaining one with the most similar gate vector, weighted
+                by their token counts, and routes its tokens there; this changes every token routed to a merge
+                target as well.
+            calibration: optional block inputs [B, N, dim] to measure the change of the block output on.
+
+        Returns:
+            a report with the kept and removed experts, the share of the routed slots and of the gate weight the
+            removed experts received, the number of parameters freed and, with `calibration`, the relative change
+            ||y_pruned - y|| / ||y|| of the block output as `relative_error`.
+        """
+        if mode not in ('drop', 'merge'):
+            raise ValueError(f'Unsupported mode {mode}, available: {["drop", "merge"]}')
+        if self.gate.expert_map is not None:
+            raise ValueError("Experts were already pruned, reload the model to prune again")
+        stats = self.gate.routing_stats
+        if stats is None or stats.tokens == 0:
+            raise ValueError("No routing statistics, collect them with `enable_routing_stats` first")
+
+        num_experts = len(self.experts)
+        usage = stats.usage().cpu()
+        ranked = usage.argsort(descending=True).tolist()
+        keep = sorted(i for rank, i in enumerate(ranked) if rank < self.moe_top_k or usage[i] >= min_usage)
+        removed = [i for i in range(num_experts) if i not in keep]
+
+        reference = None
+        if calibration is not None:
+            with paused_routing_stats(self):
+                reference = self(calibration)
+
+        expert_map = torch.full((num_experts,), -1, dtype=torch.long)
+        expert_map[keep] = torch.arange(len(keep))
+        if mode == 'merge' and removed:
+            gate_weight = F.normalize(self.gate.weight.float(), dim=-1)
+            similarity = gate_weight[removed] @ gate_weight[keep].T
+            targets = [keep[j] for j in similarity.argmax(dim=-1).tolist()]
+            counts = stats.counts.double().cpu() + 1e-6
+            for target in set(targets):
+                group = [target] + [i for i, t in zip(removed, targets) if t == target]
+                weights = counts[group] / counts[group].sum()
+                for params in zip(*[self.experts[i].parameters() for i in group]):
+                    params[0].copy_(sum(w.item() * p.double() for w, p in zip(weights, params)).to(params[0].dtype))
+            for i, target in zip(removed, targets):
+                expert_map[i] = expert_map[target]
+
+        params_removed = sum(p.numel() for i in removed for p in self.experts[i].parameters())
+        self.experts = nn.ModuleList([self.experts[i] for i in keep])
+        self._stacked_experts = None
+        self.gate.set_expert_map(expert_map)
+
+        gate_mass = stats.gate_mass.cpu()
+        report = {
+            'mode': mode,
+            'kept': keep,
+            'removed': removed,
+            'removed_usage': float(usage[removed].sum()),
+            'removed_gate_mass': float(gate_mass[removed].sum() / gate_mass.sum().clamp(min=1e-20)),
+            'params_removed': params_removed,
+        }
+        if reference is not None:
+            with paused_routing_stats(self):
+                report['relative_error'] = relative_error(self(calibration), reference)
+        return report
+
+    def stacked_experts(self):
+        """
+        The expert feed-forward weights stacked along a leading expert dimension, laid out for `x @ w`:
+            w1: [E, dim + pad, inner], the input projections with their biases as row `dim`, so appending a 1 to
+                the tokens adds them inside the matmul. The rows are padded to a multiple of 8 for alignment.
+                Without biases, [E, dim, inner].
+            w2: [E, inner, dim], the output projections.
+            b2: [E, dim], their biases, or None.
+        These are copies, the expert parameters are left as they are. They are stacked again when a parameter
+        was replaced (e.g. by `.to()`) or modified in place (e.g. by `load_state_dict`).
+        """
+        layers = [(expert.net[0].proj, expert.net[2]) for expert in self.experts]
+        params = [param for layer in layers for module in layer for param in (module.weight, module.bias)
+                  if param is not None]
+        key = tuple((param.data_ptr(), param._version) for param in params)
+        if self._stacked_experts is not None and self._stacked_experts[0] == key:
+            return self._stacked_experts[1]
+
+        proj_in, proj_out = layers[0]
+        num_experts, inner_dim, dim = len(layers), proj_in.weight.shape[0], proj_in.weight.shape[1]
+        rows = dim if proj_in.bias is None else dim + 8 - dim % 8
+        w1 = proj_in.weight.new_zeros((num_experts, rows, inner_dim))
+        w2 = proj_out.weight.new_empty((num_experts, inner_dim, proj_out.weight.shape[0]))
+        b2 = None if proj_out.bias is None else proj_out.bias.new_empty((num_experts, proj_out.bias.shape[0]))
+        for i, (proj_in, proj_out) in enumerate(layers):
+            w1[i, :dim] = proj_in.weight.t()
+            w2[i] = proj_out.weight.t()
+            if proj_in.bias is not None:
+                w1[i, dim] = proj_in.bias
+            if b2 is not None:
+                b2[i] = proj_out.bias
+        self._stacked_experts = (key, (w1, w2, b2))
+        return self._stacked_experts[1]
+
     @torch.no_grad()
     def moe_infer(self, x, flat_expert_indices, flat_expert_weights):
+        """
+        Routed experts of every token, all experts at once. Token copies are sorted by expert and go through
+        both expert layers as one grouped matmul (`torch._grouped_mm`) over the stacked expert weights, with the
+        group offsets kept on the device, so nothing waits on the host. Where the grouped matmul is not
+        available, the groups are padded to the largest one and run as one batched matmul, which reads that size
+        back once. The input biases are applied inside the first matmul and the output biases as one
+        [tokens, experts] x [experts, dim] product of the routing weights. Experts with other activations than
+        GELU run one by one.
+        """
+        if not all(isinstance(expert.net[0], GELU) for expert in self.experts):
+            return self.moe_infer_loop(x, flat_expert_indices, flat_expert_weights)
+
+        w1, w2, b2 = self.stacked_experts()
+        num_experts, dim = len(self.experts), x.shape[-1]
+        order = flat_expert_indices.argsort(stable=True)
+        sorted_experts = flat_expert_indices[order]
+        token_idxs = order // self.moe_top_k
+        tokens_per_expert = flat_expert_indices.bincount(minlength=num_experts)
+        if w1.shape[1] > dim:
+            # a constant 1 feature picks up the input biases stored in w1
+            x_in = F.pad(x, (0, w1.shape[1] - dim))
+            x_in[:, dim] = 1
+        else:
+            x_in = x
+        expert_tokens = x_in[token_idxs]
+
+        approximate = self.experts[0].net[0].approximate
+        if (x.device.type, x.dtype) not in _GROUPED_MM_UNSUPPORTED and hasattr(torch, '_grouped_mm'):
+            offsets = tokens_per_expert.cumsum(0).to(torch.int32)
+            try:
+                hidden = torch._grouped_mm(expert_tokens, w1, offs=offsets)
+                # in place, the activations of all experts are one large buffer
+                torch.ops.aten.gelu_(hidden, approximate=approximate)
+                expert_out = torch._grouped_mm(hidden, w2, offs=offsets)
+            except RuntimeError:
+                _GROUPED_MM_UNSUPPORTED.add((x.device.type, x.dtype))
+                return self.moe_infer(x, flat_expert_indices, flat_expert_weights)
+        else:
+            capacity = int(tokens_per_expert.max())
+            starts = tokens_per_expert.cumsum(0) - tokens_per_expert
+            slots = torch.arange(order.shape[0], device=x.device) - starts[sorted_experts]
+            padded = x.new_zeros((num_experts, capacity, expert_tokens.shape[-1]))
+            padded[sorted_experts, slots] = expert_tokens
+            hidden = torch.ops.aten.gelu_(torch.bmm(padded, w1), approximate=approximate)
+            expert_out = torch.bmm(hidden, w2)[sorted_experts, slots]
+
+        expert_out.mul_(flat_expert_weights[order])
+        y = torch.zeros_like(x, dtype=expert_out.dtype).index_add_(0, token_idxs, expert_out)
+        if b2 is not None:
+            # the output biases, weighted by the routing weights of every token
+            routing = flat_expert_weights.new_zeros((x.shape[0], num_experts)).scatter_add_(
+                1, flat_expert_indices.view(-1, self.moe_top_k), flat_expert_weights.view(-1, self.moe_top_k))
+            y = y + routing.to(b2.dtype) @ b2
+        return y
+
+    @torch.no_grad()
+    def moe_infer_loop(self, x, flat_expert_indices, flat_expert_weights):
+        """Expert by expert, for the activations `moe_infer` does not batch."""
         expert_cache = torch.zeros_like(x)
         idxs = flat_expert_indices.argsort()
         tokens_per_expert = flat_expert_indices.bincount().cpu().numpy().cumsum(0)
@@ -149,3 +396,79 @@ class MoEBlock(nn.Module):
             expert_cache = expert_cache.to(expert_out.dtype)
             expert_cache.scatter_reduce_(0, exp_token_idx.view(-1, 1).repeat(1, x.shape[-1]), expert_out, reduce='sum')
         return expert_cache
+
+
+def enable_routing_stats(model: nn.Module, enabled: bool = True) -> Dict[str, RoutingStats]:
+    """Attach a fresh `RoutingStats` to every `MoEGate` of `model` (or detach them), keyed by module name."""
+    collectors = {}
+    for name, module in model.named_modules():
+        if isinstance(module, MoEGate):
+            module.routing_stats = RoutingStats(module.n_routed_experts) if enabled else None
+            if enabled:
+                collectors[name] = module.routing_stats
+    return collectors
+
+
+def routing_stats_report(model: nn.Module, path: Optional[str] = None) -> Dict[str, dict]:
+    """Per-layer routing statistics of `model`, see `RoutingStats.as_dict`, also written as JSON to `path`."""
+    report = {name: module.routing_stats.as_dict() for name, module in model.named_modules()
+              if isinstance(module, MoEGate) and module.routing_stats is not None}
+    if path is not None:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+@contextmanager
+def paused_routing_stats(model: nn.Module):
+    """Detach the routing statistics collectors of `model` for the duration, e.g. of calibration passes."""
+    gates = [module for module in model.modules() if isinstance(module, MoEGate)]
+    collectors = [gate.routing_stats for gate in gates]
+    for gate in gates:
+        gate.routing_stats = None
+    try:
+        yield
+    finally:
+        for gate, collector in zip(gates, collectors):
+            gate.routing_stats = collector
+
+
+def relative_error(output: torch.Tensor, reference: torch.Tensor) -> float:
+    """||output - reference|| / ||reference||."""
+    return float((output.float() - reference.float()).norm() / reference.float().norm().clamp(min=1e-20))
+
+
+@torch.no_grad()
+def prune_moe_experts(
+    model: nn.Module,
+    min_usage: float,
+    mode: str = 'drop',
+    calibration: Optional[Callable[[], torch.Tensor]] = None,
+) -> Dict[str, dict]:
+    """
+    `MoEBlock.prune_experts` on every MoE layer of `model`, returns the per-layer reports.
+
+    `calibration` runs one forward pass of `model`, e.g. `lambda: model(x, t, contexts)`, and returns its output.
+    It is called before and after pruning: every layer reports the change of its output on the inputs it received
+    in the first pass, and the change of the model output is reported under 'output'.
+    """
+    blocks = {name: module for name, module in model.named_modules() if isinstance(module, MoEBlock)}
+    inputs = {name: [] for name in blocks}
+    reference = None
+    if calibration is not None:
+        hooks = [block.register_forward_pre_hook(lambda module, args, name=name: inputs[name].append(args[0]))
+                 for name, block in blocks.items()]
+        try:
+            with paused_routing_stats(model):
+                reference = calibration()
+        finally:
+            for hook in hooks:
+                hook.remove()
+
+    reports = {name: block.prune_experts(min_usage, mode=mode,
+                                         calibration=torch.cat(inputs[name]) if inputs[name] else None)
+               for name, block in blocks.items()}
+    if reference is not None:
+        with paused_routing_stats(model):
+            reports['output'] = {'relative_error': relative_error(calibration(), reference)}
+    return reports
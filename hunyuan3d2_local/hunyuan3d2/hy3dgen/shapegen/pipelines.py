@@ -28,7 +28,9 @@ from diffusers.utils.import_utils import is_accelerate_version, is_accelerate_av
 from tqdm import tqdm
 
 from .models.autoencoders import ShapeVAE
-from .models.autoencoders import SurfaceExtractors
+from .models.autoencoders import DecodedShape, SurfaceExtractors
+from .models.denoisers import FeatureCache, narrow_batch
+from .schedulers import FlowMatchSchedulers, FlowMatchEulerDiscreteSchedulerOutput
 from .utils import logger, synchronize_timer, smart_load_model
 
 
@@ -93,11 +95,17 @@ def retrieve_timesteps(
 
 @synchronize_timer('Export to trimesh')
 def export_to_trimesh(mesh_output):
+    if isinstance(mesh_output, dict):
+        # levels of detail of one sample
+        return {resolution: export_to_trimesh(mesh) if mesh is not None else None
+                for resolution, mesh in mesh_output.items()}
     if isinstance(mesh_output, list):
         outputs = []
         for mesh in mesh_output:
             if mesh is None:
                 outputs.append(None)
+            elif isinstance(mesh, dict):
+                outputs.append(export_to_trimesh(mesh))
             else:
                 mesh.mesh_f = mesh.mesh_f[:, ::-1]
                 mesh_output = trimesh.Trimesh(mesh.mesh_v, mesh.mesh_f)
@@ -306,6 +314,34 @@ class Hunyuan3DDiTPipeline:
                 self.vae = ShapeVAE.from_pretrained(model_path, subfolder=subfolder)
             self.vae.enable_flashvdm_decoder(enabled=False)
 
+    def enable_feature_cache(
+        self,
+        enabled: bool = True,
+        num_shallow_blocks: int = 1,
+        refresh_interval: Optional[int] = None,
+        threshold: Optional[float] = 0.2,
+    ):
+        """
+        Reuse the deep block outputs of the denoiser between sampling steps, refreshed every `refresh_interval`
+        steps and/or when the shallow blocks drift by more than `threshold`, see `FeatureCache`. The default
+        threshold keeps the relative output change to a few percent; pass `threshold=None` to refresh on the
+        interval only.
+        """
+        if not hasattr(self.model, 'feature_cache'):
+            raise ValueError(f"{self.model.__class__.__name__} does not support feature caching")
+        self.model.feature_cache = FeatureCache(
+            num_shallow_blocks=num_shallow_blocks,
+            refresh_interval=refresh_interval,
+            threshold=threshold,
+        ) if enabled else None
+
+    def reset_feature_cache(self) -> Optional[FeatureCache]:
+        """Clear the feature cache of the denoiser, if any, before a sampling run and return it."""
+        feature_cache = getattr(self.model, 'feature_cache', None)
+        if feature_cache is not None:
+            feature_cache.reset()
+        return feature_cache
+
     def to(self, device=None, dtype=None):
         if dtype is not None:
             self.dtype = dtype
@@ -462,6 +498,22 @@ class Hunyuan3DDiTPipeline:
                 cond = cat_recursive(cond, un_cond)
         return cond
 
+    @staticmethod
+    def repeat_condition(cond, repeats, num_branches=1):
+        """
+        Repeat every sample of an encoded condition `repeats` times, within each of the `num_branches` guidance
+        branches `encode_cond` stacks along the batch.
+        """
+        if isinstance(cond, torch.Tensor):
+            return torch.cat([branch.repeat_interleave(repeats, dim=0) for branch in cond.chunk(num_branches)])
+        return {k: Hunyuan3DDiTPipeline.repeat_condition(v, repeats, num_branches) for k, v in cond.items()}
+
+    def prepare_condition(self, cond, **kwargs):
+        # denoisers exposing `prepare_condition` run their timestep-invariant work once per call
+        if not hasattr(self.model, 'prepare_condition'):
+            return cond
+        return self.model.prepare_condition(cond, **kwargs)
+
     def prepare_extra_step_kwargs(self, generator, eta):
         # prepare extra kwargs for the scheduler step, since not all schedulers have the same signature
         # eta (η) is only used with the DDIMScheduler, it will be ignored for other schedulers.
@@ -479,13 +531,80 @@ class Hunyuan3DDiTPipeline:
             extra_step_kwargs["generator"] = generator
         return extra_step_kwargs
 
-    def prepare_latents(self, batch_size, dtype, device, generator, latents=None):
-        shape = (batch_size, *self.vae.latent_shape)
-        if isinstance(generator, list) and len(generator) != batch_size:
+    def prepare_generators(self, generator, batch_size, device):
+        """`generator` is a torch.Generator, a seed, or a list of either with one entry per sample."""
+        if isinstance(generator, (list, tuple)):
+            if len(generator) != batch_size:
+                raise ValueError(
+                    f"You have passed a list of generators of length {len(generator)}, but requested an effective"
+                    f" batch size of {batch_size}. Make sure the batch size matches the length of the generators."
+                )
+            return [torch.Generator(device).manual_seed(g) if isinstance(g, int) else g for g in generator]
+        if isinstance(generator, int):
+            return torch.Generator(device).manual_seed(generator)
+        return generator
+
+    def prepare_guidance_scales(self, guidance_scale, batch_size):
+        """
+        A single scale is returned as is; a list (one scale per sample) becomes a float tensor of shape [B].
+        Samples with a negative scale run without guidance, i.e. with a scale of 1.
+        """
+        if not isinstance(guidance_scale, (list, tuple, torch.Tensor)):
+            return guidance_scale
+        guidance_scale = torch.as_tensor(guidance_scale, dtype=torch.float32).reshape(-1)
+        if guidance_scale.shape[0] != batch_size:
             raise ValueError(
-                f"You have passed a list of generators of length {len(generator)}, but requested an effective batch"
-                f" size of {batch_size}. Make sure the batch size matches the length of the generators."
+                f"You have passed {guidance_scale.shape[0]} guidance scales, but requested an effective batch size"
+                f" of {batch_size}."
             )
+        return guidance_scale
+
+    @staticmethod
+    def prepare_step_counts(num_inference_steps, batch_size):
+        """
+        A single step count is returned as is, a list (one count per sample) as a list of ints, or as an int when
+        all counts are equal.
+        """
+        if not isinstance(num_inference_steps, (list, tuple)):
+            return num_inference_steps
+        if len(num_inference_steps) != batch_size:
+            raise ValueError(
+                f"You have passed {len(num_inference_steps)} step counts, but requested an effective batch size"
+                f" of {batch_size}."
+            )
+        step_counts = [int(n) for n in num_inference_steps]
+        return step_counts[0] if len(set(step_counts)) == 1 else step_counts
+
+    @staticmethod
+    def guide(noise_pred_cond, noise_pred_uncond, guidance_scale):
+        """Classifier-free guidance with one scale for the batch or one scale per sample."""
+        if isinstance(guidance_scale, torch.Tensor):
+            guidance_scale = torch.where(guidance_scale >= 0, guidance_scale, torch.ones_like(guidance_scale))
+            guidance_scale = guidance_scale.to(noise_pred_cond).view(-1, *[1] * (noise_pred_cond.ndim - 1))
+        return noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+
+    @staticmethod
+    def guidance_converged(noise_pred_cond, noise_pred_uncond, min_cosine=None, max_relative_norm=None) -> bool:
+        """
+        Whether the conditional and unconditional predictions agree closely enough, in every sample, for the
+        unconditional branch to be dropped: cosine similarity of at least `min_cosine`, or
+        ||cond - uncond|| / ||cond|| of at most `max_relative_norm`.
+        """
+        if min_cosine is None and max_relative_norm is None:
+            return False
+        cond = noise_pred_cond.flatten(1).float()
+        uncond = noise_pred_uncond.flatten(1).float()
+        if min_cosine is not None and \
+                torch.nn.functional.cosine_similarity(cond, uncond, dim=1).min().item() >= min_cosine:
+            return True
+        if max_relative_norm is not None:
+            relative_norm = (cond - uncond).norm(dim=1) / cond.norm(dim=1).clamp(min=1e-12)
+            return relative_norm.max().item() <= max_relative_norm
+        return False
+
+    def prepare_latents(self, batch_size, dtype, device, generator, latents=None):
+        shape = (batch_size, *self.vae.latent_shape)
+        generator = self.prepare_generators(generator, batch_size, device)
 
         if latents is None:
             latents = randn_tensor(shape, generator=generator, device=device, dtype=dtype)
@@ -555,7 +674,12 @@ class Hunyuan3DDiTPipeline:
                     'pipeline.vae.surface_extractor = SurfaceExtractors[mc_algo]() instead\n')
         if mc_algo not in SurfaceExtractors.keys():
             raise ValueError(f"Unknown mc_algo {mc_algo}")
-        self.vae.surface_extractor = SurfaceExtractors[mc_algo]()
+        # keep the current extractor (and the worker pool it may hold) when the algorithm does not change
+        if type(self.vae.surface_extractor) is not SurfaceExtractors[mc_algo]:
+            previous = self.vae.surface_extractor
+            self.vae.surface_extractor = SurfaceExtractors[mc_algo]()
+            if hasattr(previous, 'close'):
+                previous.close()
 
     @torch.no_grad()
     def __call__(
@@ -576,6 +700,7 @@ class Hunyuan3DDiTPipeline:
         mc_algo=None,
         output_type: Optional[str] = "trimesh",
         enable_pbar=True,
+        lod_resolutions=None,
         **kwargs,
     ) -> List[List[trimesh.Trimesh]]:
         callback = kwargs.pop("callback", None)
@@ -613,6 +738,9 @@ class Hunyuan3DDiTPipeline:
             guidance_cond = self.get_guidance_scale_embedding(
                 guidance_scale_tensor, embedding_dim=self.model.guidance_cond_proj_dim
             ).to(device=device, dtype=latents.dtype)
+
+        prepared_cond = self.prepare_condition(cond, guidance_cond=guidance_cond)
+        feature_cache = self.reset_feature_cache()
         with synchronize_timer('Diffusion Sampling'):
             for i, t in enumerate(tqdm(timesteps, disable=not enable_pbar, desc="Diffusion Sampling:", leave=False)):
                 # expand the latents if we are doing classifier free guidance
@@ -625,7 +753,7 @@ class Hunyuan3DDiTPipeline:
                 # predict the noise residual
                 timestep_tensor = torch.tensor([t], dtype=t_dtype, device=device)
                 timestep_tensor = timestep_tensor.expand(latent_model_input.shape[0])
-                noise_pred = self.model(latent_model_input, timestep_tensor, cond, guidance_cond=guidance_cond)
+                noise_pred = self.model(latent_model_input, timestep_tensor, prepared_cond, guidance_cond=guidance_cond)
 
                 # no drop, drop clip, all drop
                 if do_classifier_free_guidance:
@@ -647,11 +775,15 @@ class Hunyuan3DDiTPipeline:
                 if callback is not None and i % callback_steps == 0:
                     step_idx = i // getattr(self.scheduler, "order", 1)
                     callback(step_idx, t, outputs)
+        del prepared_cond
+        if feature_cache is not None:
+            logger.info(f"Feature cache hit rate: {feature_cache.hit_rate:.2f}")
 
         return self._export(
             latents,
             output_type,
             box_v, mc_level, num_chunks, octree_resolution, mc_algo,
+            lod_resolutions=lod_resolutions,
         )
 
     def _export(
@@ -663,8 +795,12 @@ class Hunyuan3DDiTPipeline:
         num_chunks=20000,
         octree_resolution=256,
         mc_algo='mc',
-        enable_pbar=True
+        enable_pbar=True,
+        lod_resolutions=None,
     ):
+        if output_type == 'decoded_shape':
+            # keep the decoded shape around to mesh it again with other parameters
+            return DecodedShape.from_diffusion_latents(self.vae, latents)
         if not output_type == "latent":
             latents = 1. / self.vae.scale_factor * latents
             latents = self.vae(latents)
@@ -676,6 +812,7 @@ class Hunyuan3DDiTPipeline:
                 octree_resolution=octree_resolution,
                 mc_algo=mc_algo,
                 enable_pbar=enable_pbar,
+                lod_resolutions=lod_resolutions,
             )
         else:
             outputs = latents
@@ -691,42 +828,92 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
     Pipeline para generación de modelos 3D únicamente con geometría (sin texturas).
     """
 
+    def get_scheduler(self, solver=None, solver_options=None):
+        """
+        Scheduler of one sampling call: `self.scheduler`, or a new `FlowMatchSchedulers[solver]` one built from its
+        config and `solver_options`. The pipeline scheduler is left as is, so a solver only applies to its call.
+        """
+        if solver is None:
+            if solver_options:
+                raise ValueError("`solver_options` need a `solver`")
+            return self.scheduler
+        if solver not in FlowMatchSchedulers.keys():
+            raise ValueError(f"Unknown solver {solver}, available: {list(FlowMatchSchedulers.keys())}")
+        return FlowMatchSchedulers[solver].from_config(self.scheduler.config, **(solver_options or {}))
+
     @torch.inference_mode()
     def __call__(
         self,
         image: Union[str, List[str], Image.Image, dict, List[dict]] = None,
-        num_inference_steps: int = 50,
+        num_inference_steps: Union[int, List[int]] = 50,
         timesteps: List[int] = None,
         sigmas: List[float] = None,
         eta: float = 0.0,
-        guidance_scale: float = 5.0,
+        guidance_scale: Union[float, List[float]] = 5.0,
         generator=None,
         box_v=1.01,
         octree_resolution=384,
         mc_level=0.0,
         mc_algo=None,
-        num_chunks=8000,
+        num_chunks: Union[int, List[int]] = 8000,
         output_type: Optional[str] = "trimesh",
         enable_pbar=True,
+        lod_resolutions=None,
+        num_variations: int = 1,
+        cfg_truncation_fraction: Optional[float] = None,
+        cfg_truncation_cosine: Optional[float] = None,
+        cfg_truncation_norm: Optional[float] = None,
+        solver: Optional[str] = None,
+        solver_options: Optional[dict] = None,
         **kwargs,
     ) -> List[List[trimesh.Trimesh]]:
         """
         Genera un modelo 3D solo con geometría (sin texturas).
+
+        Con una lista de imágenes, `guidance_scale`, `num_inference_steps`, `generator` (o semillas) y `num_chunks`
+        aceptan también una lista con un valor por imagen, para servir peticiones distintas en una sola llamada.
+        Las muestras con el mismo número de pasos comparten planificador; todos los grupos avanzan en el mismo bucle
+        y las muestras que terminan antes quedan fijas hasta el final. Esto no se combina con `sigmas`.
+
+        Con `num_variations` > 1 cada imagen se codifica una sola vez y genera `num_variations` mallas con ruido
+        inicial distinto, muestreadas y decodificadas en un solo lote. La salida tiene una malla por imagen y
+        variación, ordenadas por imagen; `generator` puede dar una semilla por malla.
+
+        La guía sin clasificador (CFG) puede cortarse durante el muestreo; desde ese paso solo se evalúa la rama
+        condicional, con la mitad del lote:
+            cfg_truncation_fraction: tras esta fracción de los pasos.
+            cfg_truncation_cosine: cuando la similitud coseno entre las predicciones condicional e incondicional
+                alcanza este valor en todas las muestras.
+            cfg_truncation_norm: cuando ||cond - uncond|| / ||cond|| baja de este valor en todas las muestras.
+        Los pasos con y sin CFG quedan en `self.guidance_stats`.
+
+        `solver` elige el integrador de la EDO ('euler', 'heun', 'midpoint', 'adams_bashforth' o 'dpmpp', ver
+        `FlowMatchSchedulers`) solo para esta llamada, sin cambiar `self.scheduler`. 'heun' y 'midpoint' evalúan el
+        modelo dos veces por intervalo; 'adams_bashforth' y 'dpmpp' reutilizan las velocidades de pasos anteriores
+        con una sola evaluación por paso. 'adaptive' elige el tamaño de cada paso según el error estimado;
+        `solver_options` fija su tolerancia y el máximo de evaluaciones del modelo, p. ej.
+        {'tolerance': 1e-2, 'max_nfe': 30}, y también `solver_order` de los métodos multipaso. Las
+        evaluaciones del modelo de la llamada quedan en `self.sampling_stats['nfe']`.
         """
         callback = kwargs.pop("callback", None)
         callback_steps = kwargs.pop("callback_steps", None)
 
         self.set_surface_extractor(mc_algo)
+        scheduler = self.get_scheduler(solver, solver_options)
 
         device = self.device
         dtype = self.dtype
-        do_classifier_free_guidance = guidance_scale >= 0 and not (
-            hasattr(self.model, 'guidance_embed') and
-            self.model.guidance_embed is True
-        )
 
         cond_inputs = self.prepare_image(image)
         image = cond_inputs.pop('image')
+        guidance_scale = self.prepare_guidance_scales(guidance_scale, image.shape[0])
+        if isinstance(num_chunks, (list, tuple)):
+            # the samples are decoded together, the smallest chunk bounds the memory of all of them
+            num_chunks = min(num_chunks)
+        do_classifier_free_guidance = bool((torch.as_tensor(guidance_scale) >= 0).any()) and not (
+            hasattr(self.model, 'guidance_embed') and
+            self.model.guidance_embed is True
+        )
         cond = self.encode_cond(
             image=image,
             additional_cond_inputs=cond_inputs,
@@ -734,52 +921,127 @@ class Hunyuan3DDiTFlowMatchingPipeline(Hunyuan3DDiTPipeline):
             dual_guidance=False,
         )
         batch_size = image.shape[0]
+        if num_variations > 1:
+            # the variations of an image share its encoded condition
+            cond = self.repeat_condition(cond, num_variations, 2 if do_classifier_free_guidance else 1)
+            if isinstance(guidance_scale, torch.Tensor):
+                guidance_scale = guidance_scale.repeat_interleave(num_variations)
+            batch_size *= num_variations
 
         # 5. Prepare timesteps
         # NOTE: this is slightly different from common usage, we start from 0.
-        sigmas = np.linspace(0, 1, num_inference_steps) if sigmas is None else sigmas
-        timesteps, num_inference_steps = retrieve_timesteps(
-            self.scheduler,
-            num_inference_steps,
-            device,
-            sigmas=sigmas,
-        )
+        step_counts = self.prepare_step_counts(num_inference_steps, image.shape[0])
+        if isinstance(step_counts, list):
+            step_counts = [n for n in step_counts for _ in range(num_variations)]
+            if sigmas is not None:
+                raise ValueError("`sigmas` cannot be combined with one `num_inference_steps` per image")
+            # samples with the same step count share a scheduler, the others get a copy of it
+            groups = {}
+            for index, n in enumerate(step_counts):
+                groups.setdefault(n, []).append(index)
+            groups = [(n, torch.tensor(indices, device=device)) for n, indices in groups.items()]
+            schedulers = [scheduler] + [type(scheduler).from_config(scheduler.config) for _ in groups[1:]]
+        else:
+            groups, schedulers = [(step_counts, None)], [scheduler]
+        group_timesteps = []
+        for (n, _), group_scheduler in zip(groups, schedulers):
+            group_timesteps.append(retrieve_timesteps(
+                group_scheduler,
+                n,
+                device,
+                sigmas=np.linspace(0, 1, n) if sigmas is None else sigmas,
+            )[0])
+        num_steps = max(len(timesteps) for timesteps in group_timesteps)
         latents = self.prepare_latents(batch_size, dtype, device, generator)
 
         guidance = None
         if hasattr(self.model, 'guidance_embed') and \
             self.model.guidance_embed is True:
-            guidance = torch.tensor([guidance_scale] * batch_size, device=device, dtype=dtype)
+            guidance = torch.as_tensor(guidance_scale, device=device, dtype=dtype).expand(batch_size)
             # logger.info(f'Using guidance embed with scale {guidance_scale}')
 
-        with synchronize_timer('Diffusion Sampling'):
-            for i, t in enumerate(tqdm(timesteps, disable=not enable_pbar, desc="Diffusion Sampling:")):
+        prepared_cond = self.prepare_condition(cond, guidance=guidance)
+        feature_cache = self.reset_feature_cache()
+        use_cfg = do_classifier_free_guidance
+        self.guidance_stats = {'cfg_steps': 0, 'single_steps': 0}
+        # every group walks its own timesteps, samples whose group is done keep their latents and last timestep
+        iterators = [iter(timesteps) for timesteps in group_timesteps]
+        sample_timesteps = latents.new_zeros(batch_size)
+        with synchronize_timer('Diffusion Sampling'), \
+                tqdm(total=num_steps, disable=not enable_pbar, desc="Diffusion Sampling:") as pbar:
+            for i in range(num_steps):
+                current = [(group, group_scheduler, t) for group, group_scheduler, t in
+                           zip(groups, schedulers, (next(iterator, None) for iterator in iterators)) if t is not None]
+                if not current:
+                    break
+                pbar.update()
+                if use_cfg and cfg_truncation_fraction is not None and i >= cfg_truncation_fraction * num_steps:
+                    use_cfg = False
+                    # from here on only the conditional half of the condition batch is evaluated
+                    prepared_cond = narrow_batch(prepared_cond, 0, batch_size)
+
                 # expand the latents if we are doing classifier free guidance
-                if do_classifier_free_guidance:
+                if use_cfg:
                     latent_model_input = torch.cat([latents] * 2)
                 else:
                     latent_model_input = latents
 
                 # NOTE: we assume model get timesteps ranged from 0 to 1
-                timestep = t.expand(latent_model_input.shape[0]).to(
-                    latents.dtype) / self.scheduler.config.num_train_timesteps
-                noise_pred = self.model(latent_model_input, timestep, cond, guidance=guidance)
+                if len(groups) == 1:
+                    t = current[0][2]
+                    timestep = t.expand(latent_model_input.shape[0]).to(
+                        latents.dtype) / scheduler.config.num_train_timesteps
+                else:
+                    for (_, indices), _, t in current:
+                        sample_timesteps[indices] = t.to(latents.dtype) / scheduler.config.num_train_timesteps
+                    timestep = sample_timesteps.repeat(latent_model_input.shape[0] // batch_size)
+                noise_pred = self.model(latent_model_input, timestep, prepared_cond, guidance=guidance)
 
-                if do_classifier_free_guidance:
+                if use_cfg:
                     noise_pred_cond, noise_pred_uncond = noise_pred.chunk(2)
-                    noise_pred = noise_pred_uncond + guidance_scale * (noise_pred_cond - noise_pred_uncond)
+                    noise_pred = self.guide(noise_pred_cond, noise_pred_uncond, guidance_scale)
+                    self.guidance_stats['cfg_steps'] += 1
+                    if self.guidance_converged(noise_pred_cond, noise_pred_uncond, cfg_truncation_cosine,
+                                               cfg_truncation_norm):
+                        use_cfg = False
+                        prepared_cond = narrow_batch(prepared_cond, 0, batch_size)
+                else:
+                    self.guidance_stats['single_steps'] += 1
 
                 # compute the previous noisy sample x_t -> x_t-1
-                outputs = self.scheduler.step(noise_pred, t, latents)
-                latents = outputs.prev_sample
+                if len(groups) == 1:
+                    outputs = scheduler.step(noise_pred, t, latents)
+                    latents = outputs.prev_sample
+                else:
+                    latents = latents.clone()
+                    for (_, indices), group_scheduler, t in current:
+                        latents[indices] = group_scheduler.step(noise_pred[indices], t, latents[indices]).prev_sample
+                    t = current[0][2]
+                    outputs = FlowMatchEulerDiscreteSchedulerOutput(prev_sample=latents)
 
                 if callback is not None and i % callback_steps == 0:
-                    step_idx = i // getattr(self.scheduler, "order", 1)
+                    step_idx = i // getattr(scheduler, "order", 1)
                     callback(step_idx, t, outputs)
+        del prepared_cond
+        scheduler_stats = {}
+        for group_scheduler in schedulers:
+            for key, value in getattr(group_scheduler, 'stats', {}).items():
+                scheduler_stats[key] = scheduler_stats.get(key, 0) + value
+        self.sampling_stats = dict(
+            nfe=self.guidance_stats['cfg_steps'] + self.guidance_stats['single_steps'],
+            **self.guidance_stats,
+            **scheduler_stats,
+            **(feature_cache.stats if feature_cache is not None else {}),
+        )
+        logger.info(f"Sampling ran {self.sampling_stats['nfe']} model calls, {self.guidance_stats['cfg_steps']} "
+                    f"with CFG and {self.guidance_stats['single_steps']} without")
+        if feature_cache is not None:
+            logger.info(f"Feature cache hit rate: {feature_cache.hit_rate:.2f}")
 
         return self._export(
             latents,
             output_type,
             box_v, mc_level, num_chunks, octree_resolution, mc_algo,
             enable_pbar=enable_pbar,
+            lod_resolutions=lod_resolutions,
         )
@@ -242,6 +242,20 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         else:
             self._step_index = self._begin_index
 
+    def _check_timestep(self, timestep):
+        if (
+            isinstance(timestep, int)
+            or isinstance(timestep, torch.IntTensor)
+            or isinstance(timestep, torch.LongTensor)
+        ):
+            raise ValueError(
+                (
+                    "Passing integer indices (e.g. from `enumerate(timesteps)`) as timesteps to"
+                    f" `{self.__class__.__name__}.step()` is not supported. Make sure to pass"
+                    " one of the `scheduler.timesteps` as a timestep."
+                ),
+            )
+
     def step(
         self,
         model_output: torch.FloatTensor,
@@ -282,19 +296,7 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
                 returned, otherwise a tuple is returned where the first element is the sample tensor.
         """
 
-        if (
-            isinstance(timestep, int)
-            or isinstance(timestep, torch.IntTensor)
-            or isinstance(timestep, torch.LongTensor)
-        ):
-            raise ValueError(
-                (
-                    "Passing integer indices (e.g. from `enumerate(timesteps)`) as timesteps to"
-                    " `EulerDiscreteScheduler.step()` is not supported. Make sure to pass"
-                    " one of the `scheduler.timesteps` as a timestep."
-                ),
-            )
-
+        self._check_timestep(timestep)
         if self.step_index is None:
             self._init_step_index(timestep)
 
@@ -321,6 +323,468 @@ class FlowMatchEulerDiscreteScheduler(SchedulerMixin, ConfigMixin):
         return self.config.num_train_timesteps
 
 
+class FlowMatchHeunDiscreteScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    Heun's method (explicit trapezoidal rule) for the flow-matching ODE, second order with two velocity evaluations
+    per interval.
+
+    The intervals are the ones of `FlowMatchEulerDiscreteScheduler`, without the empty ones (such as the trailing
+    sigma = 1 -> 1 step of the pipelines). `timesteps` lists the two evaluations of every interval in turn, so the
+    sampling loop runs unchanged: the first `step` of an interval returns the Euler predictor, the second one the
+    corrected sample. `num_inference_steps` sigmas thus cost 2 * (num_inference_steps - 1) model calls.
+    """
+
+    _compatibles = []
+    order = 2
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        nodes = self.sigmas.tolist()
+        # (sigma, sigma_next) of every interval, kept on the host so stepping needs no device sync
+        self.intervals = [(a, b) for a, b in zip(nodes[:-1], nodes[1:]) if b != a]
+        stage_sigmas = [sigma for a, b in self.intervals for sigma in (a, self._stage_sigma(a, b))]
+        self.timesteps = torch.tensor(stage_sigmas, dtype=torch.float32, device=device) * \
+            self.config.num_train_timesteps
+        self.sample = None
+        self.model_output = None
+
+    @staticmethod
+    def _stage_sigma(sigma: float, sigma_next: float) -> float:
+        """Where the second velocity of the interval is evaluated."""
+        return sigma_next
+
+    @staticmethod
+    def _combine(model_output: torch.FloatTensor, stage_output: torch.FloatTensor) -> torch.FloatTensor:
+        """The velocity of the interval from its two evaluations."""
+        return (model_output + stage_output) / 2
+
+    @property
+    def state_in_first_order(self):
+        return self.sample is None
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        self._check_timestep(timestep)
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        sample = sample.to(torch.float32)
+        sigma, sigma_next = self.intervals[self.step_index // 2]
+        if self.state_in_first_order:
+            self.sample = sample
+            self.model_output = model_output.to(torch.float32)
+            prev_sample = sample + (self._stage_sigma(sigma, sigma_next) - sigma) * self.model_output
+        else:
+            velocity = self._combine(self.model_output, model_output.to(torch.float32))
+            prev_sample = self.sample + (sigma_next - sigma) * velocity
+            self.sample = None
+            self.model_output = None
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+class FlowMatchMidpointDiscreteScheduler(FlowMatchHeunDiscreteScheduler):
+    """
+    Explicit midpoint method for the flow-matching ODE: the velocity at the middle of every interval, evaluated at
+    the Euler predictor, moves the sample across the whole interval. Same cost as `FlowMatchHeunDiscreteScheduler`.
+    """
+
+    _compatibles = []
+
+    @staticmethod
+    def _stage_sigma(sigma: float, sigma_next: float) -> float:
+        return (sigma + sigma_next) / 2
+
+    @staticmethod
+    def _combine(model_output: torch.FloatTensor, stage_output: torch.FloatTensor) -> torch.FloatTensor:
+        return stage_output
+
+
+def adams_bashforth_weights(nodes: List[float], start: float, end: float) -> List[float]:
+    """
+    Weights of the velocities evaluated at `nodes` in a variable-step Adams-Bashforth step from `start` to `end`:
+    the integrals over [start, end] of the Lagrange basis polynomials of `nodes`.
+    """
+    weights = []
+    for j, node in enumerate(nodes):
+        basis = np.polynomial.Polynomial([1.0])
+        for other in nodes[:j] + nodes[j + 1:]:
+            basis = basis * np.polynomial.Polynomial([-other, 1.0]) / (node - other)
+        integral = basis.integ()
+        weights.append(float(integral(end) - integral(start)))
+    return weights
+
+
+class FlowMatchAdamsBashforthScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    Multistep Adams-Bashforth solver for the flow-matching ODE. Every step extrapolates the velocity from the last
+    `solver_order` model evaluations, so it costs one model call like Euler but is accurate to order `solver_order`
+    (the first steps use the evaluations available so far).
+
+    Args:
+        solver_order (`int`, defaults to 2):
+            Number of velocity evaluations combined per step, 1 (Euler) to 4.
+    """
+
+    _compatibles = []
+    order = 1
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        solver_order: int = 2,
+    ):
+        if not 1 <= solver_order <= 4:
+            raise ValueError(f"solver_order must be between 1 and 4, got {solver_order}")
+        super().__init__(num_train_timesteps=num_train_timesteps, shift=shift,
+                         use_dynamic_shifting=use_dynamic_shifting)
+        self.nodes = self.sigmas.tolist()
+        self.model_outputs = []
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        self.nodes = self.sigmas.tolist()
+        # (sigma, velocity) of the latest evaluations, oldest first
+        self.model_outputs = []
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        self._check_timestep(timestep)
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        sample = sample.to(torch.float32)
+        sigma, sigma_next = self.nodes[self.step_index], self.nodes[self.step_index + 1]
+        if self.model_outputs and self.model_outputs[-1][0] == sigma:
+            # repeated sigmas would make the interpolation singular, keep the latest velocity only
+            self.model_outputs.pop()
+        self.model_outputs.append((sigma, model_output.to(torch.float32)))
+        self.model_outputs = self.model_outputs[-self.config.solver_order:]
+
+        prev_sample = sample
+        if sigma_next != sigma:
+            weights = adams_bashforth_weights([node for node, _ in self.model_outputs], sigma, sigma_next)
+            for weight, (_, velocity) in zip(weights, self.model_outputs):
+                prev_sample = prev_sample + weight * velocity
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+class FlowMatchDPMSolverMultistepScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    DPM-Solver++ (multistep, data prediction) for flow matching, where x = sigma * x_0 + (1 - sigma) * noise and the
+    model predicts the velocity x_0 - noise, so x_0 = x + (1 - sigma) * velocity.
+
+    With `solver_order=1` this is exactly Euler. With `solver_order=2` (DPM-Solver++(2M)) every step also uses the
+    data prediction of the previous one, at the cost of a single model call. Steps starting from pure noise
+    (sigma = 0) or ending on the data (sigma = 1) have an infinite log-SNR step and fall back to first order, like
+    `lower_order_final` in diffusers.
+
+    Args:
+        solver_order (`int`, defaults to 2):
+            1 or 2.
+    """
+
+    _compatibles = []
+    order = 1
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        solver_order: int = 2,
+    ):
+        if solver_order not in (1, 2):
+            raise ValueError(f"solver_order must be 1 or 2, got {solver_order}")
+        super().__init__(num_train_timesteps=num_train_timesteps, shift=shift,
+                         use_dynamic_shifting=use_dynamic_shifting)
+        self.nodes = self.sigmas.tolist()
+        self.last_prediction = None
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        self.nodes = self.sigmas.tolist()
+        # (sigma, x_0 prediction) of the previous step
+        self.last_prediction = None
+
+    @staticmethod
+    def _lambda(sigma: float) -> float:
+        """Half the log-SNR, log(alpha / sigma) in DPM-Solver terms."""
+        if sigma <= 0:
+            return -math.inf
+        if sigma >= 1:
+            return math.inf
+        return math.log(sigma / (1 - sigma))
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        self._check_timestep(timestep)
+        if self.step_index is None:
+            self._init_step_index(timestep)
+
+        sample = sample.to(torch.float32)
+        sigma, sigma_next = self.nodes[self.step_index], self.nodes[self.step_index + 1]
+        x0 = sample + (1 - sigma) * model_output.to(torch.float32)
+
+        prev_sample = sample
+        if sigma_next != sigma:
+            x0_hat = x0
+            if self.config.solver_order == 2 and self.last_prediction is not None:
+                sigma_prev, x0_prev = self.last_prediction
+                lambdas = [self._lambda(s) for s in (sigma_prev, sigma, sigma_next)]
+                h_prev, h = lambdas[1] - lambdas[0], lambdas[2] - lambdas[1]
+                if all(math.isfinite(value) for value in lambdas) and h_prev > 0 and h > 0:
+                    r = h_prev / h
+                    x0_hat = (1 + 1 / (2 * r)) * x0 - 1 / (2 * r) * x0_prev
+            # x_t = (sigma_t / sigma_s) x_s + alpha_t (1 - e^-h) x_0, with alpha = sigma and sigma = 1 - sigma here
+            ratio = (1 - sigma_next) / (1 - sigma)
+            prev_sample = ratio * sample + (sigma_next - ratio * sigma) * x0_hat
+        self.last_prediction = (sigma, x0)
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index += 1
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+class AdaptiveTimesteps:
+    """
+    Timesteps of `FlowMatchAdaptiveScheduler`, decided while sampling: iterating yields the next evaluation of the
+    scheduler until it reaches the last sigma. `len` is the model call budget, an upper bound.
+    """
+
+    def __init__(self, scheduler: 'FlowMatchAdaptiveScheduler', device: Union[str, torch.device] = None):
+        self.scheduler = scheduler
+        self.device = device
+
+    def __iter__(self):
+        while self.scheduler.next_sigma is not None:
+            yield torch.tensor(self.scheduler.next_sigma * self.scheduler.config.num_train_timesteps,
+                               dtype=torch.float32, device=self.device)
+
+    def __len__(self):
+        return self.scheduler.config.max_nfe
+
+
+class FlowMatchAdaptiveScheduler(FlowMatchEulerDiscreteScheduler):
+    """
+    Error-controlled integration of the flow-matching ODE from the first to the last sigma with the
+    Bogacki-Shampine 3(2) embedded pair. A step costs three model calls, as the velocity at its end starts the next
+    one, and the gap between its third- and second-order solutions estimates the error. Steps whose error exceeds
+    `tolerance` (relative and absolute, for the worst sample of the batch) are retried shorter, and the step size
+    follows the error from one step to the next.
+
+    `timesteps` is produced on the fly (see `AdaptiveTimesteps`) and, like the stages of
+    `FlowMatchHeunDiscreteScheduler`, `step` returns the sample of the next evaluation, so the sampling loop runs
+    unchanged. `num_inference_steps` or `sigmas` only set the range and the first step size. At most `max_nfe`
+    model calls are made: when the budget cannot cover another step, the rest of the range is covered by one Euler
+    step on the last velocity. `nfe` and `stats` report the model calls and steps of the last run.
+
+    Args:
+        tolerance (`float`, defaults to 1e-2):
+            Error allowed per step, relative to the sample magnitude plus the same absolute amount.
+        max_nfe (`int`, defaults to 50):
+            Budget of model calls.
+        safety (`float`, defaults to 0.9):
+            Factor on the step size predicted from the error.
+        min_step (`float`, defaults to 1e-3):
+            Smallest step in sigma, always accepted.
+    """
+
+    _compatibles = []
+    order = 1
+
+    # Bogacki-Shampine: stage nodes, stage weights (the last row is the third-order solution) and error weights
+    nodes = (1 / 2, 3 / 4, 1)
+    weights = ((1 / 2,), (0, 3 / 4), (2 / 9, 1 / 3, 4 / 9))
+    error_weights = (-5 / 72, 1 / 12, 1 / 9, -1 / 8)
+
+    @register_to_config
+    def __init__(
+        self,
+        num_train_timesteps: int = 1000,
+        shift: float = 1.0,
+        use_dynamic_shifting=False,
+        tolerance: float = 1e-2,
+        max_nfe: int = 50,
+        safety: float = 0.9,
+        min_step: float = 1e-3,
+    ):
+        if max_nfe < 1:
+            raise ValueError(f"max_nfe must be at least 1, got {max_nfe}")
+        super().__init__(num_train_timesteps=num_train_timesteps, shift=shift,
+                         use_dynamic_shifting=use_dynamic_shifting)
+        self.next_sigma = None
+        self.nfe = 0
+        self.stats = {}
+
+    def set_timesteps(
+        self,
+        num_inference_steps: int = None,
+        device: Union[str, torch.device] = None,
+        sigmas: Optional[List[float]] = None,
+        mu: Optional[float] = None,
+    ):
+        super().set_timesteps(num_inference_steps, device=device, sigmas=sigmas, mu=mu)
+        nodes = self.sigmas.tolist()
+        steps = [b - a for a, b in zip(nodes[:-1], nodes[1:]) if b > a]
+        self.sigma, self.sigma_end = nodes[0], nodes[-1]
+        self.step_size = steps[0] if steps else 0.0
+        # the sample and velocity at `sigma`, the later stage velocities of the current step and its solution
+        self.sample = None
+        self.velocity = None
+        self.stages = []
+        self.candidate = None
+        self.next_sigma = self.sigma
+        self.nfe = 0
+        self.stats = {'accepted_steps': 0, 'rejected_steps': 0}
+        self.timesteps = AdaptiveTimesteps(self, device)
+
+    def _stage_input(self) -> torch.FloatTensor:
+        stage = len(self.stages)
+        velocities = [self.velocity] + self.stages
+        sample = self.sample
+        for weight, velocity in zip(self.weights[stage], velocities):
+            if weight != 0:
+                sample = sample + self.step_size * weight * velocity
+        self.next_sigma = self.sigma + self.nodes[stage] * self.step_size
+        if stage == len(self.weights) - 1:
+            self.candidate = sample
+        return sample
+
+    def _begin_step(self) -> torch.FloatTensor:
+        remaining = self.sigma_end - self.sigma
+        if remaining <= 0:
+            self.next_sigma = None
+            return self.sample
+        if self.config.max_nfe - self.nfe < len(self.nodes):
+            # the budget cannot cover another step, finish on the last velocity
+            self.sigma = self.sigma_end
+            self.next_sigma = None
+            return self.sample + remaining * self.velocity
+        self.step_size = min(self.step_size, remaining)
+        if remaining - self.step_size < self.config.min_step:
+            self.step_size = remaining
+        return self._stage_input()
+
+    def _end_step(self, velocity: torch.FloatTensor) -> torch.FloatTensor:
+        velocities = [self.velocity] + self.stages + [velocity]
+        error = sum(weight * v for weight, v in zip(self.error_weights, velocities)) * self.step_size
+        scale = self.config.tolerance * (1 + torch.maximum(self.sample.abs(), self.candidate.abs()))
+        ratio = (error / scale).pow(2).flatten(1).mean(dim=1).sqrt().max().item()
+
+        if ratio <= 1 or self.step_size <= self.config.min_step:
+            self.sigma += self.step_size
+            self.sample = self.candidate
+            self.velocity = velocity
+            self.stats['accepted_steps'] += 1
+        else:
+            self.stats['rejected_steps'] += 1
+        factor = 5.0 if ratio == 0 else min(max(self.config.safety * ratio ** (-1 / 3), 0.2), 5.0)
+        self.step_size = max(self.step_size * factor, self.config.min_step)
+        self.stages = []
+        self.candidate = None
+        return self._begin_step()
+
+    def step(
+        self,
+        model_output: torch.FloatTensor,
+        timestep: Union[float, torch.FloatTensor],
+        sample: torch.FloatTensor,
+        generator: Optional[torch.Generator] = None,
+        return_dict: bool = True,
+    ) -> Union[FlowMatchEulerDiscreteSchedulerOutput, Tuple]:
+        self._check_timestep(timestep)
+        if self.next_sigma is None:
+            raise ValueError("The adaptive scheduler reached the end of the range, call `set_timesteps` first")
+
+        self.nfe += 1
+        velocity = model_output.to(torch.float32)
+        if self.velocity is None:
+            self.sample = sample.to(torch.float32)
+            self.velocity = velocity
+            prev_sample = self._begin_step()
+        elif len(self.stages) < len(self.weights) - 1:
+            self.stages.append(velocity)
+            prev_sample = self._stage_input()
+        else:
+            prev_sample = self._end_step(velocity)
+
+        prev_sample = prev_sample.to(model_output.dtype)
+        self._step_index = self.nfe
+
+        if not return_dict:
+            return (prev_sample,)
+
+        return FlowMatchEulerDiscreteSchedulerOutput(prev_sample=prev_sample)
+
+
+FlowMatchSchedulers = {
+    'euler': FlowMatchEulerDiscreteScheduler,
+    'heun': FlowMatchHeunDiscreteScheduler,
+    'midpoint': FlowMatchMidpointDiscreteScheduler,
+    'adams_bashforth': FlowMatchAdamsBashforthScheduler,
+    'dpmpp': FlowMatchDPMSolverMultistepScheduler,
+    'adaptive': FlowMatchAdaptiveScheduler,
+}
+
+
 @dataclass
 class ConsistencyFlowMatchEulerDiscreteSchedulerOutput(BaseOutput):
     prev_sample: torch.FloatTensor